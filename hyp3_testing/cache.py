@@ -0,0 +1,123 @@
+"""A persistent, checksum-verified cache of HyP3 product files"""
+
+import json
+import os
+import shutil
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional
+
+CHUNK_SIZE = 2 ** 20
+LISTING_FILE = 'listing.json'
+INDEX_FILE = 'index.json'
+
+
+def crc32(path: Path) -> int:
+    checksum = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+
+def link_or_copy(source: Path, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class ProductCache:
+    """Product files cached across test sessions, keyed by job ID, file name, and checksum
+
+    Files are stored under `{directory}/{job_id}/` along with an index of their sizes and CRC-32 checksums. A cached
+    file is only returned if it still matches its index entry (and any expected size/checksum), so a corrupt or
+    partial file is never reused. When the cache grows beyond `max_size` bytes, the least recently used files are
+    evicted.
+    """
+
+    def __init__(self, directory: Path, max_size: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._lock = threading.RLock()
+
+    def _read_json(self, job_id: str, name: str) -> Optional[dict]:
+        path = self.directory / job_id / name
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def _write_json(self, job_id: str, name: str, content: dict):
+        path = self.directory / job_id / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(content))
+
+    def get_listing(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._read_json(job_id, LISTING_FILE)
+
+    def put_listing(self, job_id: str, listing: dict) -> dict:
+        with self._lock:
+            self._write_json(job_id, LISTING_FILE, listing)
+        return listing
+
+    def get(self, job_id: str, name: str, size: Optional[int] = None, crc: Optional[int] = None) -> Optional[Path]:
+        with self._lock:
+            entry = (self._read_json(job_id, INDEX_FILE) or {}).get(name)
+
+        path = self.directory / job_id / name
+        if entry is None or not path.exists():
+            return None
+
+        if size is not None and size != entry['size']:
+            return None
+        if crc is not None and crc != entry['crc']:
+            return None
+        if path.stat().st_size != entry['size'] or crc32(path) != entry['crc']:
+            path.unlink()
+            return None
+
+        path.touch()  # mark as recently used
+        return path
+
+    def put(self, job_id: str, name: str, source: Path) -> Path:
+        path = self.directory / job_id / name
+        link_or_copy(source, path)
+        path.touch()
+        entry = {'size': path.stat().st_size, 'crc': crc32(path)}
+
+        with self._lock:
+            index = self._read_json(job_id, INDEX_FILE) or {}
+            index[name] = entry
+            self._write_json(job_id, INDEX_FILE, index)
+
+        self.evict()
+        return path
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self._cached_files())
+
+    def _cached_files(self):
+        for path in self.directory.rglob('*'):
+            if not path.is_file() or path.parent == self.directory:
+                continue
+            if path.parent.parent == self.directory and path.name in (LISTING_FILE, INDEX_FILE):
+                continue
+            yield path
+
+    def evict(self):
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            cached_files = sorted(self._cached_files(), key=lambda path: path.stat().st_mtime_ns)
+            total_size = sum(path.stat().st_size for path in cached_files)
+            for path in cached_files:
+                if total_size <= self.max_size:
+                    break
+                total_size -= path.stat().st_size
+                path.unlink()
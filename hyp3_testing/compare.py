@@ -1,25 +1,67 @@
 """Tools for comparing datasets"""
 
-import filecmp
+import copy
+import hashlib
+import mmap
+import multiprocessing
+import os
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
 from functools import singledispatch
+from itertools import repeat
 from os import listdir
 from pathlib import Path
-from typing import Hashable, Optional, Union
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
+import rasterio
 import scipy
 import xarray as xr
 from osgeo import gdal
+from rasterio import Affine
 from rasterio.crs import CRS
 from rasterio.errors import CRSError
+from rasterio.windows import Window
 
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = None
 
+from hyp3_testing import instrumentation
 from hyp3_testing.helpers import clarify_xr_message
+from hyp3_testing.index import ComparisonIndex, comparison_key
+from hyp3_testing.raster import Raster, read_header
 
 XR = Union[xr.Dataset, xr.DataArray, xr.Variable]
 
+# https://numpy.org/doc/stable/reference/generated/numpy.dtype.kind.html#numpy.dtype.kind
+EXACT_DTYPE_KINDS = ["M", "m", "O", "S", "U"]
+
+DIGEST_CHUNK_SIZE = 16 * 2 ** 20
+# Files modified more recently than this may be modified again without changing their mtime, so aren't memoized
+RACY_INTERVAL_NS = 2 * 10 ** 9
+_DIGESTS = {}
+# Parsed file headers, memoized like `_DIGESTS`
+_RASTER_HEADERS = {}
+_NETCDF_HEADERS = {}
+_RASTER_INFOS = {}
+
+PYRAMID_LEVELS = 4
+PYRAMID_MIN_SIZE = 64
+
+# Side length, in pixels, of the tiles summarized by `tile_differences`
+TILE_SIZE = 256
+# Elements per chunk of the difference statistics kernel; small enough for the chunk buffers to stay in cache
+DIFF_CHUNK_SIZE = 2 ** 16
+# Dataset variables compared concurrently by `_dataset_message` (each holding `DIFF_CHUNK_SIZE` element buffers)
+MAX_DIFF_BUFFERS = min(4, os.cpu_count() or 1)
+
 
 class ComparisonFailure(Exception):
     """Exception to raise when a comparison fails"""
@@ -29,65 +71,337 @@ class ToleranceFailure(Exception):
     """Exception to raise when a tolerance fails"""
 
 
+class _DifferenceStatistics:
+    """Running statistics of `reference - secondary` differences, accumulated one block at a time
+
+    Blocks are combined with Chan et al.'s parallel variance algorithm, so only the current block is held in memory.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update_extrema(self, values: np.ndarray):
+        # Note: starting from the first block's extrema keeps their dtype, so integer differences print as integers,
+        # and complex values are ordered lexicographically, like `np.ma.MaskedArray.min`/`max`
+        minimum, maximum = values.min(), values.max()
+        self.min = minimum if self.min is None else np.minimum(self.min, minimum)
+        self.max = maximum if self.max is None else np.maximum(self.max, maximum)
+
+    def update(self, values: np.ndarray):
+        count = values.size
+        if count == 0:
+            return
+
+        mean = values.mean(dtype=np.result_type(values.dtype, np.float64))
+        m2 = np.square(np.abs(values - mean), dtype=np.float64).sum()
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + np.abs(delta) ** 2 * self.count * count / total
+        self.count = total
+        self.update_extrema(values)
+
+    @property
+    def var(self) -> float:
+        return self.m2 / self.count
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.var)
+
+
+def _compute_digest(path: Path, size: int) -> str:
+    digest = hashlib.blake2b()
+    if size == 0:
+        return digest.hexdigest()
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            for offset in range(0, size, DIGEST_CHUNK_SIZE):
+                digest.update(view[offset:offset + DIGEST_CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+def _memoized_by_stat(cache: dict, path: Path, compute: Callable[[Path, os.stat_result], Any]) -> Any:
+    # Note: values of files modified within RACY_INTERVAL_NS aren't memoized, since they may still be changing
+    stat = os.stat(path)
+    key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    if (value := cache.get(key)) is None:
+        value = compute(path, stat)
+        if time.time_ns() - stat.st_mtime_ns > RACY_INTERVAL_NS:
+            cache[key] = value
+    return value
+
+
+def file_digest(path: Path) -> str:
+    """BLAKE2 digest of a file, memoized by (path, size, mtime) so each file is read at most once"""
+    return _memoized_by_stat(_DIGESTS, path, lambda path, stat: _compute_digest(path, stat.st_size))
+
+
+@instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
 def bit_for_bit(reference: Path, secondary: Path):
-    filecmp.clear_cache()
-    if not filecmp.cmp(reference, secondary, shallow=False):
+    if os.path.getsize(reference) != os.path.getsize(secondary) or file_digest(reference) != file_digest(secondary):
         raise ComparisonFailure('Files differ at the binary level')
 
 
-def _assert_mask_similarity(reference: np.array, secondary: np.array, mask_rate: float = 0.95):
-    data_main = np.ma.masked_invalid(reference)
-    data_deve = np.ma.masked_invalid(secondary)
-    # compare mask
-    valid_mask_and = np.bitwise_and(~data_main.mask, ~data_deve.mask)
-    valid_mask_or = np.bitwise_or(~data_main.mask, ~data_deve.mask)
-    msk_rate = valid_mask_and.sum()/valid_mask_or.sum()
+@dataclass(frozen=True)
+class RasterStatistics:
+    """Validity masks and summary statistics shared by the raster comparison functions"""
+    valid: np.ndarray  # pixels that are valid in both rasters
+    reference_nodata_count: int
+    secondary_nodata_count: int
+    valid_and_count: int
+    valid_or_count: int
+    reference_mean: float
+    secondary_mean: float
+
+
+@instrumentation.instrumented('compare')
+def compute_raster_statistics(reference: np.array, secondary: np.array) -> RasterStatistics:
+    """Build the validity masks of two rasters once, for reuse by every raster comparison function"""
+    reference_valid = np.isfinite(reference)
+    secondary_valid = np.isfinite(secondary)
+    valid = reference_valid & secondary_valid
+
+    reference_valid_count = np.count_nonzero(reference_valid)
+    secondary_valid_count = np.count_nonzero(secondary_valid)
+    valid_and_count = np.count_nonzero(valid)
+
+    return RasterStatistics(
+        valid=valid,
+        reference_nodata_count=reference.size - reference_valid_count,
+        secondary_nodata_count=secondary.size - secondary_valid_count,
+        valid_and_count=valid_and_count,
+        valid_or_count=reference_valid_count + secondary_valid_count - valid_and_count,
+        reference_mean=np.mean(reference, where=reference_valid),
+        secondary_mean=np.mean(secondary, where=secondary_valid),
+    )
+
+
+def _assert_mask_similarity(reference: np.array, secondary: np.array, mask_rate: float = 0.95,
+                            statistics: Optional[RasterStatistics] = None):
+    if statistics is None:
+        statistics = compute_raster_statistics(reference, secondary)
+
+    msk_rate = statistics.valid_and_count / statistics.valid_or_count
     if msk_rate <= mask_rate:
         raise AssertionError(
             f'Two masks match with less than {mask_rate}')
 
 
-def maskes_are_within_similarity_threshold(reference: np.array, secondary: np.array, mask_rate: float = 0.95):
+@instrumentation.instrumented('compare')
+def maskes_are_within_similarity_threshold(reference: np.array, secondary: np.array, mask_rate: float = 0.95,
+                                           statistics: Optional[RasterStatistics] = None):
     try:
-        _assert_mask_similarity(reference=reference, secondary=secondary, mask_rate=mask_rate)
+        _assert_mask_similarity(reference=reference, secondary=secondary, mask_rate=mask_rate,
+                                statistics=statistics)
     except AssertionError as e:
         raise ComparisonFailure(
             '\n'.join(['Values are different.', '', clarify_xr_message(str(e))])
         )
 
 
-def _assert_within_statistic(reference: np.array, secondary: np.array, confidence_level: float = 0.99):
-    data_main = np.ma.masked_invalid(reference)
-    data_deve = np.ma.masked_invalid(secondary)
+def _histogram_ks_2samp(reference: np.ndarray, secondary: np.ndarray, bins: int = 4096, sample_size: int = 1_000_000,
+                        seed: int = 0) -> Tuple[float, float]:
+    # Empirical CDFs evaluated on shared histogram edges instead of on every sorted sample
+    # Note: the edges are quantiles of the pooled values (or of a pooled subsample), not equal-width, so each bin holds
+    # a similar share of the pixels even when a few outliers of heavy-tailed data stretch the value range
+    rng = np.random.default_rng(seed)
+    pooled = np.concatenate([
+        values if values.size <= sample_size // 2 else rng.choice(values, size=sample_size // 2, replace=False)
+        for values in (reference, secondary)
+    ])
+    edges = np.unique(np.quantile(pooled, np.linspace(0, 1, bins + 1)))
+    edges = np.concatenate([
+        [min(reference.min(), secondary.min())], edges[1:-1], [max(reference.max(), secondary.max())]
+    ])
+
+    reference_cdf = np.cumsum(np.histogram(reference, bins=edges)[0]) / reference.size
+    secondary_cdf = np.cumsum(np.histogram(secondary, bins=edges)[0]) / secondary.size
+    statistic = np.abs(reference_cdf - secondary_cdf).max()
+    return statistic, _asymptotic_ks_pvalue(statistic, reference.size, secondary.size)
+
+
+def _asymptotic_ks_pvalue(statistic: float, reference_size: int, secondary_size: int) -> float:
+    # Note: same asymptotic two-sided p-value as `scipy.stats.ks_2samp(method='asymp')`
+    effective_size = np.round(reference_size * secondary_size / (reference_size + secondary_size))
+    return scipy.stats.kstwo.sf(statistic, effective_size)
+
+
+def _ks_2samp(reference: np.ndarray, secondary: np.ndarray, method: str = 'exact', bins: int = 4096,
+              sample_size: int = 1_000_000, seed: int = 0) -> Tuple[float, float]:
+    if method == 'exact':
+        results = scipy.stats.ks_2samp(reference, secondary, alternative='two-sided', method='auto')
+        return results.statistic, results.pvalue
+
+    if method == 'histogram':
+        return _histogram_ks_2samp(reference, secondary, bins=bins, sample_size=sample_size, seed=seed)
+
+    if method == 'subsample':
+        if reference.size <= sample_size:
+            results = scipy.stats.ks_2samp(reference, secondary, alternative='two-sided', method='auto')
+            return results.statistic, results.pvalue
+
+        # Note: the same pixels are sampled from both rasters, and the sampled statistic estimates the statistic of
+        # every pixel, so its p-value is computed for the full sample sizes, like the `exact` test would
+        sample = np.random.default_rng(seed).choice(reference.size, size=sample_size, replace=False)
+        statistic = scipy.stats.ks_2samp(reference[sample], secondary[sample], alternative='two-sided').statistic
+        return statistic, _asymptotic_ks_pvalue(statistic, reference.size, secondary.size)
+
+    raise ValueError(f'Unknown KS test method {method}; must be one of: exact, histogram, subsample')
+
+
+def _assert_within_statistic(reference: np.array, secondary: np.array, confidence_level: float = 0.99,
+                             method: str = 'exact', statistics: Optional[RasterStatistics] = None, **kwargs):
+    if statistics is None:
+        valid_mask = np.isfinite(reference) & np.isfinite(secondary)
+    else:
+        valid_mask = statistics.valid
+
+    reference, secondary = reference[valid_mask], secondary[valid_mask]
+    if np.iscomplexobj(reference) or np.iscomplexobj(secondary):
+        # Note: test each component on (strided) views of the valid complex values, which are only gathered once
+        components = {' (real component)': (reference.real, secondary.real),
+                      ' (imaginary component)': (reference.imag, secondary.imag)}
+    else:
+        components = {'': (reference, secondary)}
+
+    for component, (reference_values, secondary_values) in components.items():
+        _, pvalue = _ks_2samp(reference_values, secondary_values, method=method, **kwargs)
+        if pvalue < confidence_level:
+            raise AssertionError(
+                f'Two data{component} are not similar with confidence level {confidence_level*100} % '
+                f'({method} KS test)'
+            )
+
+
+@instrumentation.instrumented('compare')
+def values_are_within_statistic(reference: np.array, secondary: np.array, confidence_level: float = 0.95,
+                                method: str = 'exact', bins: int = 4096, sample_size: int = 1_000_000,
+                                seed: int = 0, statistics: Optional[RasterStatistics] = None,
+                                difference_map: Optional[Path] = None):
+    """Compare the distributions of the valid pixels with a two-sample Kolmogorov-Smirnov test
+
+    The `exact` method tests every valid pixel. For large rasters, the `histogram` method instead computes the KS
+    statistic from the CDFs on `bins` shared histogram edges (quantiles of a pooled sample of up to `sample_size`
+    pixels), and the `subsample` method estimates it from a reproducible random sample of `sample_size` pixels drawn
+    using `seed`. Both compute the p-value for the full
+    number of valid pixels, so their verdicts approximate the `exact` method's; the subsampled statistic is noisier,
+    so near the confidence level it tends to be slightly stricter. The real and imaginary components of complex
+    rasters are tested separately. On failure, the `tile_differences` of the rasters are written to `difference_map`,
+    if provided.
+    """
+    try:
+        _assert_within_statistic(reference=reference, secondary=secondary, confidence_level=confidence_level,
+                                 method=method, statistics=statistics, bins=bins, sample_size=sample_size, seed=seed)
+    except AssertionError as e:
+        messages = ['Values are different.', '', clarify_xr_message(str(e))]
+        if difference_map is not None:
+            save_tile_differences(difference_map, tile_differences(reference, secondary))
+            messages.append(f'Tile differences written to {difference_map}')
+        raise ComparisonFailure('\n'.join(messages))
+
+
+def _gradient_shift(reference: np.ndarray, secondary: np.ndarray) -> Tuple[float, float]:
+    mgs_obj = cv2.reg_MapperGradShift()
+    result = mgs_obj.calculate(reference, secondary)
+    x_shift, y_shift = cv2.reg.MapTypeCaster.toShift(result).getShift().flatten()
+    return x_shift, y_shift
+
+
+def _cross_power_spectrum(reference: np.ndarray, secondary: np.ndarray) -> np.ndarray:
+    window = cv2.createHanningWindow(reference.shape[::-1], cv2.CV_32F)
+    reference_spectrum = scipy.fft.fft2(reference.astype(np.float32) * window, workers=-1)
+    secondary_spectrum = scipy.fft.fft2(secondary.astype(np.float32) * window, workers=-1)
+    return reference_spectrum * secondary_spectrum.conj()
+
+
+def _correlation_peak_shift(cross_power: np.ndarray) -> Tuple[float, float]:
+    correlation = np.abs(scipy.fft.ifft2(cross_power, workers=-1))
+    peak = np.array(np.unravel_index(np.argmax(correlation), correlation.shape), dtype=float)
+    shape = np.array(correlation.shape)
+    wrapped = peak > shape // 2
+    peak[wrapped] -= shape[wrapped]
+
+    # the correlation peak is at minus the shift
+    y_shift, x_shift = -peak
+    return x_shift, y_shift
+
+
+def _upsampled_dft(data: np.ndarray, region_size: int, upsample_factor: int, offsets: np.ndarray) -> np.ndarray:
+    # Matrix-multiply DFT of just a `region_size` neighborhood of the upsampled inverse transform; see:
+    # Guizar-Sicairos et al., "Efficient subpixel image registration algorithms," Opt. Lett. 33, 156-158 (2008)
+    for n_items, offset in zip(data.shape[::-1], offsets[::-1]):
+        frequencies = np.fft.fftfreq(n_items, upsample_factor)
+        kernel = np.exp(-2j * np.pi * (np.arange(region_size) - offset)[:, np.newaxis] * frequencies)
+        data = np.tensordot(kernel, data, axes=(1, -1))
+    return data
+
+
+def _refine_correlation_peak_shift(cross_power: np.ndarray, x_shift: float, y_shift: float, upsample_factor: int,
+                                   search_radius: float = 2.0) -> Tuple[float, float]:
+    region_size = int(np.ceil(2 * search_radius * upsample_factor)) + 1
+    center = region_size // 2
+    peak = -np.array([y_shift, x_shift])
+    correlation = _upsampled_dft(cross_power.conj(), region_size, upsample_factor, center - peak * upsample_factor)
+    refined_peak = np.unravel_index(np.argmax(np.abs(correlation)), correlation.shape)
+    y_shift, x_shift = -(peak + (np.array(refined_peak) - center) / upsample_factor)
+    return x_shift, y_shift
+
+
+def _fft_correlation_shift(reference: np.ndarray, secondary: np.ndarray, levels: int = PYRAMID_LEVELS,
+                           upsample_factor: int = 20) -> Tuple[float, float]:
+    # Coarse-to-fine: find the correlation peak of a downsampled image, then refine it to sub-pixel precision around
+    # the (doubled) estimate at each finer level, which only requires the DFT of a small neighborhood of the peak
+    pyramid = [(reference, secondary)]
+    while len(pyramid) < levels and min(pyramid[-1][0].shape) >= 2 * PYRAMID_MIN_SIZE:
+        pyramid.append(tuple(cv2.pyrDown(image) for image in pyramid[-1]))
+
+    x_shift, y_shift = _correlation_peak_shift(_cross_power_spectrum(*pyramid[-1]))
+    for level in range(len(pyramid) - 2, -1, -1):
+        x_shift, y_shift = _refine_correlation_peak_shift(
+            _cross_power_spectrum(*pyramid[level]), 2 * x_shift, 2 * y_shift,
+            upsample_factor=upsample_factor if level == 0 else 2,
+        )
+
+    if len(pyramid) == 1:
+        x_shift, y_shift = _refine_correlation_peak_shift(
+            _cross_power_spectrum(reference, secondary), x_shift, y_shift, upsample_factor=upsample_factor
+        )
+
+    return x_shift, y_shift
 
-    valid_mask = np.bitwise_and(~data_main.mask, ~data_deve.mask)
 
-    results = scipy.stats.ks_2samp(data_main.data[valid_mask], data_deve.data[valid_mask],
-                                   alternative='two-sided', method='auto')
+def _offset_shift(reference: np.ndarray, secondary: np.ndarray, method: str = 'gradshift',
+                  valid: Optional[np.ndarray] = None) -> Tuple[float, float]:
+    if valid is None:
+        valid = np.isfinite(reference) & np.isfinite(secondary)
+    if np.iscomplexobj(reference) or np.iscomplexobj(secondary):
+        # Note: neither OpenCV nor the image pyramid support complex data, so the offset is estimated from magnitudes
+        reference, secondary = np.abs(reference), np.abs(secondary)
+    dtype = np.result_type(reference.dtype, secondary.dtype, np.float32)
+    reference = np.where(valid, reference, 0).astype(dtype, copy=False)
+    secondary = np.where(valid, secondary, 0).astype(dtype, copy=False)
 
-    if results.pvalue < confidence_level:
-        raise AssertionError(f'Two data are not similar with confidence level {confidence_level*100} %')
+    if method == 'gradshift':
+        return _gradient_shift(reference, secondary)
 
+    if method == 'fft_correlation':
+        return _fft_correlation_shift(reference, secondary)
 
-def values_are_within_statistic(reference: np.array, secondary: np.array, confidence_level: float = 0.95):
-    try:
-        _assert_within_statistic(reference=reference, secondary=secondary, confidence_level=confidence_level)
-    except AssertionError as e:
-        raise ComparisonFailure(
-            '\n'.join(['Values are different.', '', clarify_xr_message(str(e))])
-        )
+    raise ValueError(f'Unknown offset method {method}; must be one of: gradshift, fft_correlation')
 
 
 def _assert_within_offset_distance(reference: np.array, secondary: np.array, pixel_size: int,
-                                   offset_threshold: float = 5.0):
-    data_main = np.ma.masked_invalid(reference)
-    data_deve = np.ma.masked_invalid(secondary)
-    mask = np.bitwise_or(data_main.mask, data_deve.mask)
-    data_main.data[mask] = 0
-    data_deve.data[mask] = 0
-    mgs_obj = cv2.reg_MapperGradShift()
-    result = mgs_obj.calculate(data_main.data, data_deve.data)
-    x_shift, y_shift = cv2.reg.MapTypeCaster.toShift(result).getShift().flatten()
+                                   offset_threshold: float = 5.0, method: str = 'gradshift',
+                                   statistics: Optional[RasterStatistics] = None):
+    valid = None if statistics is None else statistics.valid
+    x_shift, y_shift = _offset_shift(reference, secondary, method=method, valid=valid)
     distance_pixels = np.sqrt((x_shift**2) + (y_shift**2))
     distance = distance_pixels * pixel_size
     if distance >= offset_threshold:
@@ -96,63 +410,273 @@ def _assert_within_offset_distance(reference: np.array, secondary: np.array, pix
         )
 
 
+@instrumentation.instrumented('compare')
 def images_are_within_offset_threshold(reference: np.array, secondary: np.array, pixel_size: int = 80,
-                                       offset_threshold: float = 5.0):
+                                       offset_threshold: float = 5.0, method: str = 'gradshift',
+                                       statistics: Optional[RasterStatistics] = None):
+    """Compare the offset between two images, estimated by OpenCV's gradient shift mapper (`gradshift`) or by
+    coarse-to-fine FFT cross-correlation on an image pyramid with sub-pixel peak refinement (`fft_correlation`)
+
+    The offset between complex images is estimated once, from their magnitudes.
+    """
     try:
         _assert_within_offset_distance(reference=reference, secondary=secondary, pixel_size=pixel_size,
-                                       offset_threshold=offset_threshold)
+                                       offset_threshold=offset_threshold, method=method, statistics=statistics)
     except AssertionError as e:
         raise ComparisonFailure(
             '\n'.join(['Images are not coregistered.', '', clarify_xr_message(str(e))])
         )
 
 
-def _nodata_count_change(reference: np.array, secondary: np.array, threshold: float = 0.01):
-    data_main = np.ma.masked_invalid(reference)
-    data_deve = np.ma.masked_invalid(secondary)
+def _nodata_count_change(reference: np.array, secondary: np.array, threshold: float = 0.01,
+                         statistics: Optional[RasterStatistics] = None):
+    if statistics is None:
+        statistics = compute_raster_statistics(reference, secondary)
 
-    if (data_deve.mask.sum() - data_main.mask.sum())/data_main.mask.sum() > threshold:
+    reference_nodata, secondary_nodata = statistics.reference_nodata_count, statistics.secondary_nodata_count
+    if (secondary_nodata - reference_nodata)/reference_nodata > threshold:
         raise AssertionError(
             f'Number of nodata pixels in develop data is {threshold*100} % larger than those in main data'
         )
 
 
-def nodata_count_change_are_within_threshold(reference: np.array, secondary: np.array, threshold: float = 0.01):
+@instrumentation.instrumented('compare')
+def nodata_count_change_are_within_threshold(reference: np.array, secondary: np.array, threshold: float = 0.01,
+                                             statistics: Optional[RasterStatistics] = None):
     try:
-        _nodata_count_change(reference=reference, secondary=secondary, threshold=threshold)
+        _nodata_count_change(reference=reference, secondary=secondary, threshold=threshold, statistics=statistics)
     except AssertionError as e:
         raise ComparisonFailure(
             '\n'.join(['Images have differnt nodata pixles.', '', clarify_xr_message(str(e))])
         )
 
 
-def _corr_average_decrease(reference: np.array, secondary: np.array, threshold: float = 0.05):
-    data_main = np.ma.masked_invalid(reference)
-    data_deve = np.ma.masked_invalid(secondary)
+def _corr_average_decrease(reference: np.array, secondary: np.array, threshold: float = 0.05,
+                           statistics: Optional[RasterStatistics] = None):
+    if statistics is None:
+        statistics = compute_raster_statistics(reference, secondary)
 
-    if (data_main.mean() - data_deve.mean())/data_main.mean() > threshold:
+    reference_mean, secondary_mean = statistics.reference_mean, statistics.secondary_mean
+    if (reference_mean - secondary_mean)/reference_mean > threshold:
         raise AssertionError(
             f'Average spatial coherence has decreased by more than {threshold * 100} %'
         )
 
 
-def corr_average_decrease_within_threshold(reference: np.array, secondary: np.array, threshold: float = 0.05):
+@instrumentation.instrumented('compare')
+def corr_average_decrease_within_threshold(reference: np.array, secondary: np.array, threshold: float = 0.05,
+                                           statistics: Optional[RasterStatistics] = None):
     try:
-        _corr_average_decrease(reference=reference, secondary=secondary, threshold=threshold)
+        _corr_average_decrease(reference=reference, secondary=secondary, threshold=threshold, statistics=statistics)
     except AssertionError as e:
         raise ComparisonFailure(
             '\n'.join(['Average correlation decreases.', '', clarify_xr_message(str(e))])
         )
 
 
-def values_are_close(reference: XR, secondary: XR, rtol: float = 1e-05, atol: float = 1e-08):
-    try:
-        xr.testing.assert_allclose(reference, secondary, rtol=rtol, atol=atol)
-    except AssertionError as e:
-        detailed_failure_message = _compare_values_message(reference, secondary, rtol=rtol, atol=atol)
-        raise ComparisonFailure(
-            '\n'.join(['Values are different.', detailed_failure_message, '', clarify_xr_message(str(e))])
-        )
+def _threaded_scheduler():
+    return nullcontext() if dask is None else dask.config.set(scheduler='threads')
+
+
+@instrumentation.instrumented('compare')
+def values_are_close(reference: XR, secondary: XR, rtol: float = 1e-05, atol: float = 1e-08,
+                     difference_map: Optional[Path] = None):
+    """Assert that the values of two datasets/variables are close, describing the differences if not
+
+    Chunked (dask-backed) data is compared in bounded memory with the local threaded scheduler. On failure, the
+    `tile_differences` of each 2-D variable are written to `difference_map`, if provided.
+    """
+    with _threaded_scheduler():
+        try:
+            xr.testing.assert_allclose(reference, secondary, rtol=rtol, atol=atol)
+        except AssertionError as e:
+            detailed_failure_message = _compare_values_message(reference, secondary, rtol=rtol, atol=atol)
+            messages = ['Values are different.', detailed_failure_message, '', clarify_xr_message(str(e))]
+            if difference_map is not None:
+                differences = _variable_tile_differences(reference, secondary, rtol=rtol, atol=atol)
+                save_tile_differences(difference_map, differences)
+                messages.append(f'Tile differences written to {difference_map}')
+            raise ComparisonFailure('\n'.join(messages))
+
+
+@dataclass(frozen=True)
+class TileDifferences:
+    """Per-tile summary of the differences between two rasters, for locating where they differ
+
+    Each array has a (band, tile row, tile column) shape, and is NaN for tiles with no pixels valid in both rasters.
+    """
+    tile_size: int
+    mismatch_fraction: np.ndarray  # of the tile's pixels that aren't close (including where only one is NaN)
+    max_abs_diff: np.ndarray  # of the pixels valid in both rasters
+    ks_statistic: np.ndarray  # two-sample KS statistic of the pixels valid in both rasters (of magnitudes if complex)
+
+
+def _tile_windows(height: int, width: int, tile_size: int) -> Iterator[Tuple[int, int, Window]]:
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            window = Window(col, row, min(tile_size, width - col), min(tile_size, height - row))
+            yield row // tile_size, col // tile_size, window
+
+
+def _tile_summary(reference: np.ndarray, secondary: np.ndarray, rtol: float = 1e-05,
+                  atol: float = 1e-08) -> Tuple[float, float, float]:
+    mismatch_fraction = np.mean(~np.isclose(reference, secondary, rtol=rtol, atol=atol, equal_nan=True))
+
+    valid = np.isfinite(reference) & np.isfinite(secondary)
+    if not valid.any():
+        return mismatch_fraction, np.nan, np.nan
+
+    reference, secondary = reference[valid], secondary[valid]
+    max_abs_diff = np.abs(reference - secondary).max()
+    if np.iscomplexobj(reference) or np.iscomplexobj(secondary):
+        reference, secondary = np.abs(reference), np.abs(secondary)
+    ks_statistic = scipy.stats.ks_2samp(reference, secondary, method='asymp').statistic
+    return mismatch_fraction, max_abs_diff, ks_statistic
+
+
+def _tile_differences(bands: Iterable[Iterator[Tuple[int, int, np.ndarray, np.ndarray]]], n_bands: int,
+                      shape: Tuple[int, int], tile_size: int, rtol: float, atol: float) -> TileDifferences:
+    summary_shape = (n_bands, -(-shape[0] // tile_size), -(-shape[1] // tile_size))
+    summaries = np.full((3, *summary_shape), np.nan)
+    for band, tiles in enumerate(bands):
+        for tile_row, tile_col, reference, secondary in tiles:
+            summaries[:, band, tile_row, tile_col] = _tile_summary(reference, secondary, rtol=rtol, atol=atol)
+    return TileDifferences(tile_size, *summaries)
+
+
+@instrumentation.instrumented('compare')
+def tile_differences(reference: np.ndarray, secondary: np.ndarray, tile_size: int = TILE_SIZE, rtol: float = 1e-05,
+                     atol: float = 1e-08) -> TileDifferences:
+    """Summarize the differences between two (2-D) rasters in `tile_size` by `tile_size` pixel tiles"""
+    _check_shapes(reference, secondary)
+    tiles = (
+        (tile_row, tile_col, reference[window.toslices()], secondary[window.toslices()])
+        for tile_row, tile_col, window in _tile_windows(*reference.shape, tile_size)
+    )
+    return _tile_differences([tiles], 1, reference.shape, tile_size, rtol=rtol, atol=atol)
+
+
+def _raster_tile_differences(reference: rasterio.DatasetReader, secondary: rasterio.DatasetReader,
+                             tile_size: int = TILE_SIZE, rtol: float = 1e-05, atol: float = 1e-08) -> TileDifferences:
+    def tiles(band):
+        for tile_row, tile_col, window in _tile_windows(reference.height, reference.width, tile_size):
+            yield tile_row, tile_col, _read_block(reference, band, window), _read_block(secondary, band, window)
+
+    bands = (tiles(band) for band in range(1, reference.count + 1))
+    return _tile_differences(bands, reference.count, reference.shape, tile_size, rtol=rtol, atol=atol)
+
+
+def _variable_tile_differences(reference: XR, secondary: XR, tile_size: int = TILE_SIZE, rtol: float = 1e-05,
+                               atol: float = 1e-08) -> dict:
+    """Tile differences of each 2-D variable
+
+    Each tile is sliced from the variables before it's loaded, so chunked (dask-backed) variables are only read a tile
+    at a time.
+    """
+    if isinstance(reference, xr.Dataset):
+        pairs = {name: (reference[name], secondary[name]) for name in sorted(reference.data_vars, key=str)
+                 if name in secondary.data_vars}
+    else:
+        pairs = {getattr(reference, 'name', None) or 'values': (reference, secondary)}
+
+    differences = {}
+    for name, (ref, sec) in pairs.items():
+        if ref.ndim != 2 or set(ref.dims) != set(sec.dims) or ref.sizes != sec.sizes:
+            continue
+        if ref.dtype.kind not in 'fciu' or sec.dtype.kind not in 'fciu':
+            continue
+        sec = sec.transpose(*ref.dims)
+
+        def tiles(ref=ref, sec=sec):
+            for tile_row, tile_col, window in _tile_windows(*ref.shape, tile_size):
+                slices = window.toslices()
+                yield tile_row, tile_col, np.asarray(ref.data[slices]), np.asarray(sec.data[slices])
+
+        differences[str(name)] = _tile_differences([tiles()], 1, ref.shape, tile_size, rtol=rtol, atol=atol)
+    return differences
+
+
+def save_tile_differences(path: Path, differences: Union[TileDifferences, Dict[str, TileDifferences]],
+                          transform: Optional[Affine] = None) -> Path:
+    """Write tile differences (optionally, of several named variables) to a compressed NPZ file
+
+    Arrays are stored as `{field}` (or `{name}/{field}`), along with the `tile_size` and, if the transform of the
+    compared rasters is provided, the `transform` of the tile grid. Missing parent directories are created.
+    """
+    if isinstance(differences, TileDifferences):
+        differences = {None: differences}
+
+    arrays = {}
+    for name, tile_summary in differences.items():
+        prefix = '' if name is None else f'{name}/'
+        arrays[f'{prefix}tile_size'] = tile_summary.tile_size
+        for field in ('mismatch_fraction', 'max_abs_diff', 'ks_statistic'):
+            arrays[f'{prefix}{field}'] = getattr(tile_summary, field)
+        if transform is not None:
+            arrays[f'{prefix}transform'] = tuple(transform * Affine.scale(tile_summary.tile_size))[:6]
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    return Path(path)
+
+
+def _read_block(dataset: rasterio.DatasetReader, band: int, window: Window) -> np.ndarray:
+    # Note: mirrors `xr.open_dataset(..., engine='rasterio')`, which promotes to float and masks nodata with NaN
+    block = dataset.read(band, window=window, masked=True)
+    return block.astype(np.result_type(block.dtype, np.float32)).filled(np.nan)
+
+
+def _open_dataset(raster: Union[Path, Raster]):
+    if isinstance(raster, Raster):
+        return nullcontext(raster.dataset)
+    return rasterio.open(raster)
+
+
+@instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
+def raster_values_are_close(reference: Union[Path, Raster], secondary: Union[Path, Raster], rtol: float = 1e-05,
+                            atol: float = 1e-08, difference_map: Optional[Path] = None):
+    """Block-windowed equivalent of `values_are_close` for rasters on disk
+
+    Walks the native tiles/strips of the reference raster, so peak memory is bounded by a single block instead of
+    the full raster. On failure, the `tile_differences` of the rasters are written to `difference_map`, if provided.
+    """
+    with _open_dataset(reference) as ref, _open_dataset(secondary) as sec:
+        ref_shape = (ref.count, ref.height, ref.width)
+        sec_shape = (sec.count, sec.height, sec.width)
+        if ref_shape != sec_shape:
+            raise ComparisonFailure(
+                f'Data arrays are different shapes. Reference: {ref_shape}; secondary: {sec_shape}'
+            )
+
+        all_close = True
+        n_different = 0
+        statistics = _DifferenceStatistics()
+        for band in range(1, ref.count + 1):
+            for _, window in ref.block_windows(band):
+                ref_block = _read_block(ref, band, window)
+                sec_block = _read_block(sec, band, window)
+                all_close &= np.isclose(ref_block, sec_block, rtol=rtol, atol=atol, equal_nan=True).all()
+
+                diff = ref_block - sec_block
+                diff = diff[np.isfinite(diff)]
+                n_different += diff.size - np.isclose(diff, 0.0, rtol=rtol, atol=atol).sum()
+                statistics.update(diff)
+
+        if all_close:
+            return
+
+        size = int(np.prod(ref_shape))
+        messages = ['Values are different.']
+        if n_different:
+            messages.append(_difference_message(
+                n_different, size, statistics.max, statistics.min, statistics.mean, statistics.std, statistics.var
+            ))
+        if difference_map is not None:
+            differences = _raster_tile_differences(ref, sec, rtol=rtol, atol=atol)
+            save_tile_differences(difference_map, differences, transform=ref.transform)
+            messages.append(f'Tile differences written to {difference_map}')
+    raise ComparisonFailure('\n'.join(messages))
 
 
 @singledispatch
@@ -164,48 +688,213 @@ def _compare_values_message(reference, secondary, rtol=1e-05, atol=1e-08):
 @_compare_values_message.register(xr.Variable)
 @_compare_values_message.register(xr.DataArray)
 def _array_message(reference, secondary, rtol=1e-05, atol=1e-08):
-    # https://numpy.org/doc/stable/reference/generated/numpy.dtype.kind.html#numpy.dtype.kind
-    exact_dtypes = ["M", "m", "O", "S", "U"]
-    if reference.dtype.kind in exact_dtypes or secondary.dtype.kind in exact_dtypes:
+    if reference.dtype.kind in EXACT_DTYPE_KINDS or secondary.dtype.kind in EXACT_DTYPE_KINDS:
         if reference.values != secondary.values:
             return f'Values are different.\n    Reference: {reference.values}\n    Secondary: {secondary.values}'
         return
 
+    _check_shapes(reference, secondary)
+
+    if _is_lazy(reference, secondary):
+        return _lazy_array_messages({None: (reference, secondary)}, rtol=rtol, atol=atol)[None]
+
+    if reference.dims != secondary.dims and set(reference.dims) == set(secondary.dims):
+        secondary = secondary.transpose(*reference.dims)
+
+    n_different, statistics = _difference_statistics(np.asarray(reference.data), np.asarray(secondary.data), atol=atol)
+    if n_different == 0:
+        return None
+
+    return _difference_message(n_different, reference.size, statistics.max, statistics.min, statistics.mean,
+                               statistics.std, statistics.var)
+
+
+def _pairwise_sum(start: int, stop: int, block_sum: Callable[[int, int], Any], block_size: int, complex_: bool):
+    """Sum `[start, stop)` block by block, combining the block sums in the same order as numpy's pairwise summation
+
+    `np.add.reduce` of a contiguous array splits it in halves (rounded down to a multiple of 8 values, or of 8 floats
+    for complex values) until they're no longer than 128 values, so summing the same halves down to blocks of at most
+    `block_size` (>= 128) values gives a bit-for-bit identical sum.
+    """
+    size = stop - start
+    if size <= block_size:
+        return block_sum(start, stop)
+
+    half = (size - size % 8) // 2 if complex_ else size // 2 - size // 2 % 8
+    return (_pairwise_sum(start, start + half, block_sum, block_size, complex_)
+            + _pairwise_sum(start + half, stop, block_sum, block_size, complex_))
+
+
+def _difference_statistics(reference: np.ndarray, secondary: np.ndarray,
+                           atol: float = 1e-08) -> Tuple[int, _DifferenceStatistics]:
+    """Count the differences that aren't close to zero, and compute the statistics of the finite differences
+
+    Identical to `np.isclose(np.ma.masked_invalid(reference - secondary).filled(0.0), 0.0, atol=atol)` and the
+    masked difference statistics (`rtol` has no effect when comparing to zero), but computed in two passes (for the
+    mean, then the variance) over fixed-size chunks with preallocated buffers, instead of with several full-size
+    temporary arrays. The chunk sums are combined like numpy's pairwise summation of the whole (filled) array, and the
+    extrema keep the differences' dtype, so the difference messages are unchanged.
+    """
+    reference = reference.reshape(-1)
+    secondary = secondary.reshape(-1)
+    chunk_size = max(min(max(DIFF_CHUNK_SIZE, 128), reference.size), 1)
+
+    diff_buffer = np.empty(chunk_size, dtype=np.result_type(reference, secondary))
+    abs_buffer = np.empty(chunk_size, dtype=np.abs(diff_buffer[:1]).dtype)
+    finite_buffer = np.empty(chunk_size, dtype=bool)
+    different_buffer = np.empty(chunk_size, dtype=bool)
+    deviation_buffer = np.empty(chunk_size, dtype=np.result_type(diff_buffer.dtype, np.float64))
+    square_buffer = np.empty(chunk_size, dtype=np.abs(deviation_buffer[:1]).dtype)
+
+    def differences(start, stop):
+        diff = diff_buffer[:stop - start]
+        finite = finite_buffer[:stop - start]
+        np.subtract(reference[start:stop], secondary[start:stop], out=diff)
+        np.isfinite(diff, out=finite)
+        return diff, finite
+
+    n_different = 0
+    statistics = _DifferenceStatistics()
+
+    def sum_differences(start, stop):
+        nonlocal n_different
+        diff, finite = differences(start, stop)
+        different = different_buffer[:stop - start]
+        np.greater(np.abs(diff, out=abs_buffer[:stop - start]), atol, out=different)
+        different &= finite
+        n_different += np.count_nonzero(different)
+
+        n_finite = np.count_nonzero(finite)
+        statistics.count += n_finite
+        if n_finite < diff.size:
+            if n_finite:
+                statistics.update_extrema(diff[finite])
+            np.copyto(diff, 0, where=~finite)
+        else:
+            statistics.update_extrema(diff)
+        return np.add.reduce(diff)
+
+    def sum_squared_deviations(start, stop):
+        diff, finite = differences(start, stop)
+        deviation = np.subtract(diff, statistics.mean, out=deviation_buffer[:stop - start])
+        if np.iscomplexobj(deviation):
+            square = np.abs(deviation, out=square_buffer[:stop - start])
+        else:
+            square = deviation
+        np.multiply(square, square, out=square)
+        np.copyto(square, 0.0, where=~finite)
+        return np.add.reduce(square)
+
+    complex_ = np.iscomplexobj(diff_buffer)
+    total = _pairwise_sum(0, reference.size, sum_differences, chunk_size, complex_)
+    if statistics.count == 0:
+        return n_different, statistics
+
+    # Note: same dtype promotions as `np.ma.MaskedArray.mean`/`var`, e.g., a float32 sum divided by an intp count
+    count = np.intp(statistics.count)
+    statistics.mean = total * 1. / count
+    statistics.m2 = _pairwise_sum(0, reference.size, sum_squared_deviations, chunk_size, complex_=False)
+    statistics.count = count
+    return n_different, statistics
+
+
+def _check_shapes(reference, secondary):
     if reference.shape != secondary.shape:
         raise ComparisonFailure(
             f'Data arrays are different shapes. Reference: {reference.shape}; secondary: {secondary.shape}'
         )
 
-    diff = np.ma.masked_invalid(reference - secondary)
-    n_close = np.isclose(diff.filled(0.0), 0.0, rtol=rtol, atol=atol).sum()
 
-    n_different = diff.size - n_close
-    if n_different == 0:
-        return None
+def _is_lazy(reference, secondary) -> bool:
+    if dask is None:
+        return False
+    if reference.dtype.kind in EXACT_DTYPE_KINDS or secondary.dtype.kind in EXACT_DTYPE_KINDS:
+        return False
+    return isinstance(reference.data, da.Array) or isinstance(secondary.data, da.Array)
+
+
+def _lazy_difference_statistics(reference, secondary, rtol=1e-05, atol=1e-08) -> tuple:
+    diff = da.asarray((reference - secondary).data)
+    valid = da.isfinite(diff)
+    n_close = da.isclose(da.where(valid, diff, 0.0), 0.0, rtol=rtol, atol=atol).sum()
+
+    # Note: equivalent to the statistics of `np.ma.masked_invalid(diff)`
+    diff = da.where(valid, diff, np.nan)
+    moments = diff.astype(np.result_type(diff.dtype, np.float64))  # like `np.ma` reductions
+    statistics = (da.nanmax(diff), da.nanmin(diff), da.nanmean(moments), da.nanstd(moments), da.nanvar(moments))
+    return (diff.size - n_close, diff.size, *statistics)
+
+
+def _lazy_array_messages(variables: dict, rtol=1e-05, atol=1e-08) -> dict:
+    """Difference messages for (reference, secondary) pairs of dask-backed variables
+
+    The mismatch counts and difference statistics are reduced chunk by chunk, for every pair at once, in a single
+    `dask.compute` call with the local threaded scheduler.
+    """
+    lazy_statistics = {
+        key: _lazy_difference_statistics(reference, secondary, rtol=rtol, atol=atol)
+        for key, (reference, secondary) in variables.items()
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # e.g., all-NaN chunks
+        statistics, = dask.compute(lazy_statistics, scheduler='threads')
 
+    return {key: None if values[0] == 0 else _difference_message(*values) for key, values in statistics.items()}
+
+
+def _difference_message(n_different, size, maximum, minimum, mean, std, var) -> str:
     messages = [
-        f'{n_different:,}/{diff.size:,} ({n_different / diff.size:.2%}) values are different.',
+        f'{n_different:,}/{size:,} ({n_different / size:.2%}) values are different.',
         'Reference - secondary:',
-        f'    max {diff.max()}; min {diff.min()}; mean {diff.mean()};',
-        f'    std {diff.std()}; var {diff.var()}',
+        f'    max {maximum}; min {minimum}; mean {mean};',
+        f'    std {std}; var {var}',
     ]
     return '\n'.join(messages)
 
 
 @_compare_values_message.register
-def _dataset_message(reference: xr.Dataset, secondary, rtol=1e-05, atol=1e-08):
+def _dataset_message(reference: xr.Dataset, secondary, rtol=1e-05, atol=1e-08, max_buffers=MAX_DIFF_BUFFERS):
+    """Difference messages for each variable in both datasets, in sorted order
+
+    In-memory variables are compared concurrently on a thread pool (NumPy releases the GIL), with at most
+    `max_buffers` variables being compared at once, each holding only the `DIFF_CHUNK_SIZE` element buffers of
+    `_difference_statistics`.
+    """
     ref_vars = set(reference.keys())
     sec_vars = set(secondary.keys())
 
+    variables = sorted(ref_vars & sec_vars, key=str)
+
+    lazy_variables = {}
+    in_memory_variables = {}
+    for var in variables:
+        ref_var, sec_var = reference.variables[var], secondary.variables[var]
+        if _is_lazy(ref_var, sec_var):
+            _check_shapes(ref_var, sec_var)
+            lazy_variables[var] = (ref_var, sec_var)
+        else:
+            in_memory_variables[var] = (ref_var, sec_var)
+
+    variable_messages = {}
+    if in_memory_variables:
+        with ThreadPoolExecutor(max_workers=max_buffers) as executor:
+            results = executor.map(
+                lambda pair: _compare_values_message(*pair, rtol=rtol, atol=atol), in_memory_variables.values()
+            )
+            variable_messages.update(zip(in_memory_variables, results))
+
+    if lazy_variables:
+        variable_messages.update(_lazy_array_messages(lazy_variables, rtol=rtol, atol=atol))
+
     messages = []
-    for var in ref_vars & sec_vars:
-        msg = _compare_values_message(reference.variables[var], secondary.variables[var], rtol=rtol, atol=atol)
-        if msg is not None:
+    for var in variables:
+        if (msg := variable_messages[var]) is not None:
             messages.append(f'\nDataset variable: {var}\n{msg}')
 
     return '\n'.join(messages)
 
 
+@instrumentation.instrumented('compare')
 def compare_cf_spatial_reference(reference: xr.Dataset, secondary: xr.Dataset):
     if (ref_conventions := reference.attrs.get('Conventions')) is None:
         raise ComparisonFailure('Reference dataset does follow CF Conventions')
@@ -243,9 +932,66 @@ def compare_cf_spatial_reference(reference: xr.Dataset, secondary: xr.Dataset):
         )
 
 
-def compare_raster_info(reference: Path, secondary: Path):
-    ref_info = gdal.Info(str(reference), format='json')
-    sec_info = gdal.Info(str(secondary), format='json')
+def _read_raster_header(path: Path, stat: os.stat_result) -> dict:
+    with rasterio.open(path) as dataset:
+        return read_header(dataset)
+
+
+def _read_netcdf_header(path: Path, stat: os.stat_result) -> dict:
+    with xr.open_dataset(path) as dataset:
+        return _netcdf_header(dataset)
+
+
+def _netcdf_header(dataset: xr.Dataset) -> dict:
+    header = {f'dimension {name}': size for name, size in dataset.sizes.items()}
+    for name, variable in dataset.variables.items():
+        header[f'variable {name}'] = (variable.dims, str(variable.dtype))
+    return header
+
+
+def _raster_header(raster: Union[Path, Raster]) -> dict:
+    if isinstance(raster, Raster):
+        return raster.header
+    return _memoized_by_stat(_RASTER_HEADERS, raster, _read_raster_header)
+
+
+def _header_differences(ref_header: dict, sec_header: dict) -> List[str]:
+    return [
+        f'  {key}: reference {ref_header.get(key)}; secondary {sec_header.get(key)}'
+        for key in sorted(ref_header.keys() | sec_header.keys()) if ref_header.get(key) != sec_header.get(key)
+    ]
+
+
+@instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
+def compare_raster_headers(reference: Union[Path, Raster], secondary: Union[Path, Raster]):
+    """Compare the shapes, data types, spatial references, and nodata values of two rasters before any pixel I/O"""
+    if differences := _header_differences(_raster_header(reference), _raster_header(secondary)):
+        raise ComparisonFailure('\n'.join(['Raster headers are different.', *differences]))
+
+
+@instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
+def compare_netcdf_headers(reference: Union[Path, xr.Dataset], secondary: Union[Path, xr.Dataset]):
+    """Compare the dimensions and variables (dimensions and data types) of two netCDF datasets before any data I/O"""
+    def header(dataset):
+        if isinstance(dataset, xr.Dataset):
+            return _netcdf_header(dataset)
+        return _memoized_by_stat(_NETCDF_HEADERS, dataset, _read_netcdf_header)
+
+    if differences := _header_differences(header(reference), header(secondary)):
+        raise ComparisonFailure('\n'.join(['NetCDF headers are different.', *differences]))
+
+
+def _raster_info(raster: Union[Path, Raster]) -> dict:
+    if isinstance(raster, Raster):
+        return copy.deepcopy(raster.info)
+    info = _memoized_by_stat(_RASTER_INFOS, raster, lambda path, stat: gdal.Info(str(path), format='json'))
+    return copy.deepcopy(info)
+
+
+@instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
+def compare_raster_info(reference: Union[Path, Raster], secondary: Union[Path, Raster]):
+    ref_info = _raster_info(reference)
+    sec_info = _raster_info(secondary)
     for key in ('description', 'files'):
         ref_info.pop(key, None)
         sec_info.pop(key, None)
@@ -272,6 +1018,7 @@ def _find_wkt(variable: xr.Variable) -> Optional[str]:
     return wkt
 
 
+@instrumentation.instrumented('compare', arg_names=('main_dir', 'develop_dir'))
 def compare_product_files(main_dir: str, develop_dir: str):
     main_files = listdir(main_dir)
     develop_files = listdir(develop_dir)
@@ -289,6 +1036,7 @@ def compare_product_files(main_dir: str, develop_dir: str):
         )
 
 
+@instrumentation.instrumented('compare', arg_names=('main_parameter_file', 'develop_parameter_file'))
 def compare_parameter_files(main_parameter_file: str, develop_parameter_file: str):
     with open(str(main_parameter_file), 'r') as main_parameters:
         main_parameters = main_parameters.read()
@@ -299,3 +1047,85 @@ def compare_parameter_files(main_parameter_file: str, develop_parameter_file: st
                 raise ComparisonFailure(
                     err + f'  Reference: {main_parameters}\n  Secondary: {develop_parameters}'
                 )
+
+
+def _run_comparison(comparison: Callable[[Path, Path], None], reference: Path, secondary: Path,
+                    instrument: bool = False) -> Tuple[Optional[str], List[dict]]:
+    if instrument:
+        instrumentation.enable()
+
+    message = None
+    with instrumentation.stage('compare_files', 'file', reference=reference, secondary=secondary):
+        try:
+            comparison(reference, secondary)
+        except ComparisonFailure as e:
+            comparison_header = '\n'.join(['-' * 80, str(reference), str(secondary), '-' * 80])
+            message = f'{comparison_header}\n{e}'
+
+    # Note: send the worker's events back to be reported by the main process
+    return message, instrumentation.collect_events()
+
+
+def _collect_messages(results: Iterable[Tuple[Optional[str], List[dict]]]) -> Iterator[Optional[str]]:
+    for message, events in results:
+        instrumentation.add_events(events)
+        yield message
+
+
+def _pair_digests(reference: Path, secondary: Path) -> Tuple[str, str]:
+    return file_digest(reference), file_digest(secondary)
+
+
+def comparison_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process pool for `run_comparisons`, which can be reused for every file pair of a test
+
+    Workers are started by a fork server (or spawned, where that's unavailable) with this module preloaded, instead of
+    being forked from the calling process, which may be running other threads (e.g., prefetching downloads).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def run_comparisons(comparison: Callable[[Path, Path], None], file_pairs: Iterable[Tuple[Path, Path]],
+                    max_workers: Optional[int] = None, index: Optional[ComparisonIndex] = None,
+                    pool: Optional[ProcessPoolExecutor] = None) -> List[str]:
+    """Run a comparison on each (reference, secondary) file pair in a process pool
+
+    The comparison must be picklable (e.g., a module-level function or a `functools.partial` of one) and signal
+    differences by raising a `ComparisonFailure`. Failure messages are returned in the order of `file_pairs`. The
+    comparisons run in `pool` if provided (see `comparison_pool`), otherwise in a new pool of `max_workers` processes.
+
+    When an `index` is provided, file pairs whose contents already passed the same comparison are skipped, and the
+    verdicts of the compared pairs are recorded in it.
+    """
+    file_pairs = list(file_pairs)
+    if not file_pairs:
+        return []
+
+    if pool is None:
+        with comparison_pool(max_workers) as pool:
+            return run_comparisons(comparison, file_pairs, index=index, pool=pool)
+
+    references, secondaries = zip(*file_pairs)
+    instrument = repeat(instrumentation.is_enabled())
+    if index is None:
+        results = pool.map(_run_comparison, repeat(comparison), references, secondaries, instrument)
+        return [message for message in _collect_messages(results) if message is not None]
+
+    key = comparison_key(comparison)
+    digests = list(pool.map(_pair_digests, references, secondaries))
+    changed = [ii for ii, pair_digests in enumerate(digests) if not index.get(key, *pair_digests)]
+
+    results = pool.map(_run_comparison, repeat(comparison),
+                       [references[ii] for ii in changed], [secondaries[ii] for ii in changed], instrument)
+
+    messages = []
+    for ii, message in zip(changed, _collect_messages(results)):
+        index.put(key, *digests[ii], passed=message is None)
+        if message is not None:
+            messages.append(message)
+    return messages
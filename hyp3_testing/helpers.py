@@ -1,14 +1,93 @@
+import asyncio
 import os
+import shutil
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from contextlib import contextmanager
+from fnmatch import fnmatch
 from glob import glob
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional, Tuple
-from zipfile import ZipFile
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from zipfile import ZipFile, ZipInfo
 
+import requests
 from hyp3_sdk import Batch, HyP3, Job
-from hyp3_sdk.util import extract_zipped_product
+from hyp3_sdk.exceptions import HyP3Error
 from remotezip import RemoteZip
 
+from hyp3_testing import instrumentation
+from hyp3_testing.cache import CHUNK_SIZE, ProductCache, crc32, link_or_copy
+
+# (job_id, api, directory)
+JobLocation = Tuple[str, str, Path]
+
+# product archive listings, by job ID, for the rest of the session
+_PRODUCT_LISTINGS = {}
+
+
+class HyP3Registry:
+    """Authenticated HyP3 clients, by API URL, with memoized job lookups
+
+    Each API's client is only constructed (and logged in to Earthdata) once, and its session and connection pool are
+    shared by everything that talks to that API. The results of `find_jobs` and `get_job_by_id` are memoized for
+    `ttl` seconds, but only once every job returned is complete, so a running job's status is never stale. The `stats`
+    counter tracks the client and job lookup hits and misses.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self.stats = Counter()
+        self._clients: Dict[str, HyP3] = {}
+        self._jobs: Dict[tuple, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def client(self, api: str) -> HyP3:
+        with self._lock:
+            if (hyp3 := self._clients.get(api)) is not None:
+                self.stats['client_hits'] += 1
+                return hyp3
+
+            self.stats['client_misses'] += 1
+            hyp3 = HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+            self._clients[api] = hyp3
+            return hyp3
+
+    def _memoized(self, key: tuple, lookup):
+        with self._lock:
+            if (entry := self._jobs.get(key)) is not None and time.monotonic() < entry[0]:
+                self.stats['job_hits'] += 1
+                return entry[1]
+            self.stats['job_misses'] += 1
+
+        result = lookup()
+        if all(job.complete() for job in (result if isinstance(result, Batch) else [result])):
+            with self._lock:
+                self._jobs[key] = (time.monotonic() + self.ttl, result)
+        return result
+
+    def find_jobs(self, api: str, **kwargs) -> Batch:
+        key = ('find_jobs', api, *sorted(kwargs.items()))
+        return self._memoized(key, lambda: self.client(api).find_jobs(**kwargs))
+
+    def get_job_by_id(self, api: str, job_id: str) -> Job:
+        return self._memoized(('get_job_by_id', api, job_id), lambda: self.client(api).get_job_by_id(job_id))
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._jobs.clear()
+            self.stats.clear()
+
+
+HYP3_REGISTRY = HyP3Registry()
+
+
+def get_hyp3(api: str) -> HyP3:
+    return HYP3_REGISTRY.client(api)
+
 
 def freeze_job_parameters(job: Job) -> tuple:
     job_parameters = job.job_parameters
@@ -20,16 +99,129 @@ def sort_jobs_by_parameters(jobs: Batch) -> Batch:
     return Batch(sorted_jobs)
 
 
+@instrumentation.instrumented('hyp3', arg_names=('job_name', 'api'))
 def get_jobs_in_environment(job_name: str, api: str, user_id: Optional[str] = None) -> Batch:
-    hyp3 = HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
-    jobs = hyp3.find_jobs(name=job_name, user_id=user_id)
+    jobs = HYP3_REGISTRY.find_jobs(api, name=job_name, user_id=user_id)
     return sort_jobs_by_parameters(jobs)
 
 
-def extract_zip_files(zip_files: List[Path]):
-    for product_file in zip_files:
-        with ZipFile(product_file) as zip_:
-            zip_.extractall(path=product_file.parent)
+async def _refresh_jobs(hyp3: HyP3, jobs: List[Job]) -> List[Job]:
+    return await asyncio.gather(*(asyncio.to_thread(hyp3.refresh, job) for job in jobs))
+
+
+async def watch_job_pairs(main_hyp3: HyP3, main_jobs: Iterable[Job], develop_hyp3: HyP3, develop_jobs: Iterable[Job],
+                          interval: float = 15, max_interval: float = 300, backoff: float = 1.5,
+                          timeout: float = 10800) -> AsyncIterator[Tuple[int, Optional[Job], Optional[Job]]]:
+    """Watch the main and develop jobs concurrently, yielding `(index, main_job, develop_job)` as each pair completes
+
+    Jobs are paired up by their position in `main_jobs` and `develop_jobs` (a missing job is treated as complete), and
+    a pair is yielded as soon as both of its jobs have completed, so it can be compared while the rest are still
+    running. Each poll only refreshes the incomplete jobs, with every job in both deployments refreshed concurrently.
+    The polling interval starts at `interval` seconds and grows by a factor of `backoff` (up to `max_interval`) for
+    each poll where no job completes, resetting whenever one does. Raises a `HyP3Error` if any pair is still
+    incomplete after `timeout` seconds.
+    """
+    environments = [(main_hyp3, list(main_jobs)), (develop_hyp3, list(develop_jobs))]
+    n_pairs = max(len(jobs) for _, jobs in environments)
+    remaining = list(range(n_pairs))
+
+    deadline = time.monotonic() + timeout
+    delay = interval
+    while True:
+        for index in list(remaining):
+            pair = tuple(jobs[index] if index < len(jobs) else None for _, jobs in environments)
+            if all(job is None or job.complete() for job in pair):
+                remaining.remove(index)
+                yield (index, *pair)
+
+        if not remaining:
+            return
+
+        if (time_left := deadline - time.monotonic()) <= 0:
+            raise HyP3Error(f'Timeout occurred while waiting for {len(remaining)} of {n_pairs} job pairs')
+        await asyncio.sleep(min(delay, time_left))
+
+        pending = [[index for index, job in enumerate(jobs) if not job.complete()] for _, jobs in environments]
+        refreshed = await asyncio.gather(*(
+            _refresh_jobs(hyp3, [jobs[index] for index in indices])
+            for (hyp3, jobs), indices in zip(environments, pending)
+        ))
+
+        n_completed = 0
+        for (_, jobs), indices, refreshed_jobs in zip(environments, pending, refreshed):
+            for index, job in zip(indices, refreshed_jobs):
+                jobs[index] = job
+                n_completed += job.complete()
+
+        delay = interval if n_completed else min(delay * backoff, max_interval)
+
+
+@instrumentation.instrumented('hyp3', name='wait')
+def watch_environments(main_hyp3: HyP3, main_jobs: Iterable[Job], develop_hyp3: HyP3, develop_jobs: Iterable[Job],
+                       **kwargs) -> List[Tuple[Optional[Job], Optional[Job]]]:
+    """Wait for all the main and develop jobs to complete, returning the refreshed `(main_job, develop_job)` pairs
+
+    Unlike `watch_job_pairs`, this blocks until every pair has completed. See `watch_job_pairs` for the polling options.
+    """
+    async def watch():
+        return {
+            index: (main_job, develop_job)
+            async for index, main_job, develop_job in watch_job_pairs(
+                main_hyp3, main_jobs, develop_hyp3, develop_jobs, **kwargs
+            )
+        }
+
+    pairs = asyncio.run(watch())
+    return [pairs[index] for index in sorted(pairs)]
+
+
+def _member_path(member: ZipInfo, directory: Path) -> Path:
+    path = Path(directory) / member.filename
+    if '..' in Path(member.filename).parts or Path(member.filename).is_absolute():
+        raise ValueError(f'Refusing to extract {member.filename} outside of {directory}')
+    return path
+
+
+def _member_is_extracted(member: ZipInfo, path: Path) -> bool:
+    return path.is_file() and path.stat().st_size == member.file_size and crc32(path) == member.CRC
+
+
+def _extract_member(zip_: ZipFile, member: ZipInfo, directory: Path) -> Path:
+    """Stream a member to disk in `CHUNK_SIZE` chunks, unless it's already there with the same size and CRC-32"""
+    path = _member_path(member, directory)
+    if _member_is_extracted(member, path):
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = path.with_name(f'.{path.name}.partial')
+    with zip_.open(member) as source, open(partial_path, 'wb') as target:
+        while chunk := source.read(CHUNK_SIZE):
+            target.write(chunk)
+    os.replace(partial_path, path)
+    return path
+
+
+def _extract_archive_member(zip_file: Path, member: ZipInfo) -> Path:
+    # Note: each worker opens its own handle, so members are decompressed independently
+    with ZipFile(zip_file) as zip_:
+        return _extract_member(zip_, member, zip_file.parent)
+
+
+@instrumentation.instrumented('download', name='extract', arg_names=('zip_files',))
+def extract_zip_files(zip_files: List[Path], member_filter: Optional[str] = None, max_workers: int = 8) -> List[Path]:
+    """Extract the members of each archive (matching the `member_filter` glob pattern) next to it
+
+    Members of all the archives are decompressed concurrently by up to `max_workers` threads, and members that were
+    already extracted (with the same size and CRC-32) are skipped. Returns the member paths, in archive order.
+    """
+    members = []
+    for zip_file in zip_files:
+        with ZipFile(zip_file) as zip_:
+            members.extend((Path(zip_file), member) for member in zip_.infolist()
+                           if _member_matches(member.filename, member_filter))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda args: _extract_archive_member(*args), members))
 
 
 def find_products(directory: Path, pattern: str = '*.zip') -> dict:
@@ -78,35 +270,222 @@ def clarify_xr_message(message: str, left: str = 'reference', right: str = 'seco
     return message
 
 
-def determine_product_files(job_instance):
-    product_archive = job_instance.files[0]['url']
+def _list_product(job: Job, session: Optional[requests.Session] = None) -> dict:
+    with RemoteZip(job.files[0]['url'], session=session) as z:
+        members = [{'filename': f.filename, 'size': f.file_size, 'crc': f.CRC} for f in z.infolist()]
+    return {'filename': job.files[0]['filename'], 'url': job.files[0]['url'], 'members': members}
+
+
+def _get_product_listing(job: Job, cache: Optional[ProductCache] = None,
+                         session: Optional[requests.Session] = None) -> dict:
+    if (listing := _PRODUCT_LISTINGS.get(job.job_id)) is not None:
+        return listing
+
+    if cache is None:
+        listing = _list_product(job, session)
+    elif (listing := cache.get_listing(job.job_id)) is None:
+        listing = cache.put_listing(job.job_id, _list_product(job, session))
+
+    _PRODUCT_LISTINGS[job.job_id] = listing
+    return listing
+
 
-    with RemoteZip(product_archive) as z:
-        files = z.infolist()
+def _pooled_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
-    product_name = files[0].filename.rstrip('/')
+
+@instrumentation.instrumented('hyp3')
+def list_products(jobs: Iterable[Job], cache: Optional[ProductCache] = None, max_workers: int = 8) -> List[dict]:
+    """Read the archive directory listings of many job products concurrently
+
+    The listings are fetched over a single pooled HTTP session and are kept in memory by job ID for the rest of the
+    session (and in `cache`, when provided), so each product's directory is only read once.
+    """
+    with _pooled_session(max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: _get_product_listing(job, cache, session), jobs))
+
+
+def _normalize_product_files(listing: dict) -> Tuple[str, set]:
+    files = listing['members']
+
+    product_name = files[0]['filename'].rstrip('/')
 
     hash_name = product_name.split('_')[-1]
-    files_normalized = {f.filename.replace(hash_name, 'HASH') for f in files if not f.is_dir()}
+    files_normalized = {f['filename'].replace(hash_name, 'HASH') for f in files if not f['filename'].endswith('/')}
 
     return product_name, files_normalized
 
 
-@contextmanager
-def job_tifs(job_id, api, directory, keep=False):
-    hyp3 = HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
-    job = hyp3.get_job_by_id(job_id)
+@instrumentation.instrumented('hyp3', arg_names=('job_instance',))
+def determine_product_files(job_instance, cache=None):
+    return _normalize_product_files(_get_product_listing(job_instance, cache))
+
+
+def determine_products_files(jobs: Iterable[Job], cache: Optional[ProductCache] = None,
+                             max_workers: int = 8) -> List[Tuple[str, set]]:
+    """Like `determine_product_files`, but for many jobs with their listings fetched concurrently by `list_products`"""
+    return [_normalize_product_files(listing) for listing in list_products(jobs, cache, max_workers)]
+
+
+def download_product(job: Job, directory: Path, cache: Optional[ProductCache] = None) -> Path:
+    product_file = job.files[0]
+    if cache is not None:
+        if cached := cache.get(job.job_id, product_file['filename'], size=product_file.get('size')):
+            product = directory / product_file['filename']
+            link_or_copy(cached, product)
+            return product
+
+    product = job.download_files(directory)[0]
+    if cache is not None:
+        cache.put(job.job_id, product.name, product)
+    return product
+
+
+def _member_matches(filename: str, member_filter: Optional[str]) -> bool:
+    if filename.endswith('/'):
+        return False
+    return member_filter is None or fnmatch(Path(filename).name, member_filter)
+
+
+@instrumentation.instrumented('download', name='extract', arg_names=('directory',))
+def extract_members(zip_: ZipFile, directory: Path, member_filter: Optional[str] = None) -> List[Path]:
+    """Extract the archive members whose file name matches the `member_filter` glob pattern (default: all members)
+
+    Members are streamed to disk one at a time, so for a `RemoteZip` only the matching members are fetched, using
+    HTTP range requests. Members already extracted with the same size and CRC-32 are skipped.
+    """
+    return [
+        _extract_member(zip_, member, directory)
+        for member in zip_.infolist() if _member_matches(member.filename, member_filter)
+    ]
+
+
+def _fetch_cached_product(job_id: str, api: str, directory: Path, member_filter: Optional[str],
+                          cache: ProductCache) -> Tuple[Path, List[Path]]:
+    if (listing := cache.get_listing(job_id)) is None:
+        listing = cache.put_listing(job_id, _list_product(HYP3_REGISTRY.get_job_by_id(api, job_id)))
+
+    product_dir = directory / listing['filename'].replace('.zip', '')
+    product_dir.mkdir(parents=True, exist_ok=True)
+
+    members, missing = [], []
+    for member in listing['members']:
+        if not _member_matches(member['filename'], member_filter):
+            continue
+        members.append(directory / member['filename'])
+        if cached := cache.get(job_id, member['filename'], size=member['size'], crc=member['crc']):
+            link_or_copy(cached, directory / member['filename'])
+        else:
+            missing.append(member['filename'])
+
+    if missing:
+        with RemoteZip(listing['url']) as zip_:
+            for member in missing:
+                (directory / member).unlink(missing_ok=True)  # may be a stale link to a cached file
+                cache.put(job_id, member, Path(zip_.extract(member, path=directory)))
+
+    return product_dir, members
+
+
+@instrumentation.instrumented('download', name='fetch_product', arg_names=('job_id', 'api'))
+def _fetch_product(job_id: str, api: str, directory: Path, member_filter: Optional[str] = '*.tif',
+                   cache: Optional[ProductCache] = None) -> Tuple[Path, List[Path]]:
+    """Fetch the product members matching `member_filter`, returning the product directory and the member paths
+
+    Members already extracted (e.g., by an earlier `--keep` run) are only re-fetched if they're incomplete.
+    """
+    if cache is not None:
+        return _fetch_cached_product(job_id, api, directory, member_filter, cache)
+
+    job = HYP3_REGISTRY.get_job_by_id(api, job_id)
 
     product_dir = directory / job.files[0]['filename'].replace('.zip', '')
-    if not product_dir.exists():
-        product_archive = job.download_files(directory)[0]
-        product_dir = extract_zipped_product(product_archive)
+    with RemoteZip(job.files[0]['url']) as zip_:
+        members = extract_members(zip_, directory, member_filter)
+
+    return product_dir, members
+
+
+def _tifs(paths: Iterable[Path]) -> List[Path]:
+    return sorted(path for path in paths if path.suffix == '.tif')
+
+
+def difference_map_path(directory: Path, product_file: Path) -> Path:
+    """Where to write the tile differences of a product file in `directory`
+
+    Difference maps are kept in `directory / 'tile_differences'` so they outlive the product directories, which are
+    removed after they're compared (unless kept).
+    """
+    return directory / 'tile_differences' / Path(product_file).relative_to(directory).with_suffix('.npz')
+
+
+def _remove_product(product_dir: Path):
+    # Note: the directory is never created if no member matched the member filter
+    if product_dir.exists():
+        shutil.rmtree(product_dir)
+
 
-    tif_paths = sorted(product_dir.glob('*.tif'))
+def _pair_products(futures: List[Future], keep: bool = False) -> List[Tuple[Path, List[Path]]]:
+    """Wait for the products of a pair; if either fails, remove the other (unless kept) before re-raising"""
+    wait(futures)
     try:
-        yield tif_paths
+        return [future.result() for future in futures]
+    except Exception:
+        if not keep:
+            for future in futures:
+                if future.exception() is None:
+                    _remove_product(future.result()[0])
+        raise
+
+
+@contextmanager
+def job_tifs(job_id, api, directory, keep=False, member_filter='*.tif', cache=None):
+    product_dir, members = _fetch_product(job_id, api, directory, member_filter, cache)
+
+    try:
+        yield _tifs(members)
     finally:
         if not keep:
-            for ff in product_dir.rglob('*'):
-                ff.unlink()
-            product_dir.rmdir()
+            _remove_product(product_dir)
+
+
+def prefetch_job_tifs(job_pairs: Iterable[Tuple[JobLocation, JobLocation]], keep: bool = False, prefetch: int = 1,
+                      member_filter: Optional[str] = '*.tif',
+                      cache: Optional[ProductCache] = None) -> Iterator[Tuple[List[Path], List[Path]]]:
+    """Yield the main and develop tifs for each pair of jobs
+
+    Both products of a pair are downloaded and extracted concurrently, and the products of the next `prefetch` pairs
+    are fetched in the background while the current pair is being compared. Only the product members matching
+    `member_filter` are extracted (see `extract_members`), and are reused from `cache` when provided. Unless `keep`
+    is set, a pair's products are removed once the caller moves on to the next pair.
+    """
+    job_pairs = iter(job_pairs)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=2 * (prefetch + 1)) as executor:
+        def submit_next_pair():
+            for pair in islice(job_pairs, 1):
+                pending.append([executor.submit(_fetch_product, *job, member_filter, cache) for job in pair])
+
+        for _ in range(prefetch + 1):
+            submit_next_pair()
+
+        try:
+            while pending:
+                products = _pair_products(pending.popleft(), keep)
+                submit_next_pair()
+                try:
+                    yield tuple(_tifs(members) for _, members in products)
+                finally:
+                    if not keep:
+                        for product_dir, _ in products:
+                            _remove_product(product_dir)
+        finally:
+            # the caller stopped early, so clean up anything already prefetched
+            for future in (future for futures in pending for future in futures):
+                if not future.cancel() and not keep and future.exception() is None:
+                    _remove_product(future.result()[0])
@@ -0,0 +1,61 @@
+"""A local index of comparison verdicts, for skipping unchanged file pairs in incremental runs"""
+
+import sqlite3
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+import hyp3_testing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    comparison TEXT NOT NULL,
+    reference_digest TEXT NOT NULL,
+    secondary_digest TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    PRIMARY KEY (comparison, reference_digest, secondary_digest)
+)
+"""
+
+
+def comparison_key(comparison: Callable) -> str:
+    """Identify a comparison (including any `functools.partial` arguments, like tolerances) and the package version"""
+    arguments = ''
+    if isinstance(comparison, partial):
+        arguments = repr((comparison.args, sorted(comparison.keywords.items())))
+        comparison = comparison.func
+    version = getattr(hyp3_testing, '__version__', None)
+    return f'{version}:{comparison.__module__}.{comparison.__qualname__}{arguments}'
+
+
+class ComparisonIndex:
+    """Comparison verdicts stored in a SQLite database, keyed by the comparison and the digests of the compared files
+
+    A (reference, secondary) file pair whose contents match a pair that already passed the same comparison does not
+    need to be compared again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.execute(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def get(self, comparison: str, reference_digest: str, secondary_digest: str) -> Optional[bool]:
+        with self._connection:
+            row = self._connection.execute(
+                'SELECT passed FROM verdicts WHERE comparison = ? AND reference_digest = ? AND secondary_digest = ?',
+                (comparison, reference_digest, secondary_digest),
+            ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def put(self, comparison: str, reference_digest: str, secondary_digest: str, passed: bool):
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)',
+                (comparison, reference_digest, secondary_digest, int(passed)),
+            )
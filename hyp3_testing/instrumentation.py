@@ -0,0 +1,153 @@
+"""Per-stage timing and memory instrumentation, reported as a Chrome trace
+
+Stages are recorded as Chrome trace "complete" events (viewable in `chrome://tracing` or https://ui.perfetto.dev),
+with the resident set size (RSS) at the end of the stage and the peak RSS sampled while it was running. Recording is
+off unless `enable` has been called in the process, so instrumented functions cost a single check otherwise.
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, List, Optional
+
+SAMPLE_INTERVAL = 0.05  # seconds
+
+_ENABLED = False
+_EVENTS: List[dict] = []
+_PEAKS = {}
+_LOCK = threading.Lock()
+_SAMPLER: Optional[threading.Thread] = None
+
+
+def _rss() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:  # not Linux; fall back to the lifetime peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _reset_after_fork():
+    # Note: a forked worker inherits the parent's events (which it would send back again) and, possibly, a lock held
+    # by the parent's sampler thread, which doesn't exist in the worker
+    global _EVENTS, _PEAKS, _LOCK
+    _EVENTS = []
+    _PEAKS = {}
+    _LOCK = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _sample(interval: float):
+    while _ENABLED:
+        rss = _rss()
+        with _LOCK:
+            for key, peak in _PEAKS.items():
+                _PEAKS[key] = max(peak, rss)
+        time.sleep(interval)
+
+
+def enable(sample_interval: float = SAMPLE_INTERVAL):
+    """Start recording stages (and sampling RSS) in this process"""
+    global _ENABLED, _SAMPLER
+    _ENABLED = True
+    if _SAMPLER is None or not _SAMPLER.is_alive():
+        _SAMPLER = threading.Thread(target=_sample, args=(sample_interval,), daemon=True)
+        _SAMPLER.start()
+
+
+def disable():
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+@contextmanager
+def stage(name: str, category: str = 'stage', **args):
+    """Record the wall time and peak RSS of the enclosed block as a `name` event, annotated with `args`"""
+    if not _ENABLED:
+        yield
+        return
+
+    key = object()
+    with _LOCK:
+        _PEAKS[key] = _rss()
+    start = time.time_ns()
+    try:
+        yield
+    finally:
+        end = time.time_ns()
+        rss = _rss()
+        with _LOCK:
+            peak = max(_PEAKS.pop(key), rss)
+            _EVENTS.append({
+                'name': name, 'cat': category, 'ph': 'X',
+                'ts': start // 1000, 'dur': (end - start) // 1000,
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': {**{arg: str(value) for arg, value in args.items()},
+                         'rss_mb': rss / 2 ** 20, 'peak_rss_mb': peak / 2 ** 20},
+            })
+
+
+def instrumented(category: str, name: Optional[str] = None, arg_names: tuple = ()):
+    """Decorate a function to record each call as a stage, annotated with the arguments named in `arg_names`"""
+    def decorator(function: Callable) -> Callable:
+        stage_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return function(*args, **kwargs)
+
+            stage_args = dict(zip(function.__code__.co_varnames, args))
+            stage_args.update(kwargs)
+            with stage(stage_name, category, **{arg: stage_args.get(arg) for arg in arg_names}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def collect_events() -> List[dict]:
+    """Remove and return the events recorded so far in this process (e.g., to send them back from a worker)"""
+    with _LOCK:
+        events = _EVENTS[:]
+        _EVENTS.clear()
+    return events
+
+
+def add_events(events: List[dict]):
+    with _LOCK:
+        _EVENTS.extend(events)
+
+
+def summarize(events: List[dict]) -> dict:
+    """Total time, call count, and peak RSS of each stage"""
+    summary = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0})
+    for event in events:
+        stage_summary = summary[(event['cat'], event['name'])]
+        stage_summary['count'] += 1
+        stage_summary['seconds'] += event['dur'] / 1e6
+        stage_summary['peak_rss_mb'] = max(stage_summary['peak_rss_mb'], event['args']['peak_rss_mb'])
+    return {f'{category}:{name}': value for (category, name), value in sorted(summary.items())}
+
+
+def write_chrome_trace(path: Path, events: Optional[List[dict]] = None) -> Path:
+    """Write the recorded events (by default, all collected so far) as a Chrome trace JSON report"""
+    if events is None:
+        events = collect_events()
+    report = {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'stages': summarize(events)}}
+    Path(path).write_text(json.dumps(report, indent=2))
+    return Path(path)
@@ -0,0 +1,110 @@
+"""Open-once access to the rasters being compared, with zero-copy pixel data for uncompressed GeoTIFFs"""
+
+from functools import cached_property
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import rasterio
+from osgeo import gdal
+from rasterio.enums import Interleaving
+
+from hyp3_testing import instrumentation
+
+
+def read_header(dataset: rasterio.DatasetReader) -> dict:
+    """The structure of a raster (shape, data types, spatial reference, and nodata values), from its header alone"""
+    return {
+        'shape': (dataset.count, dataset.height, dataset.width),
+        'dtypes': tuple(dataset.dtypes),
+        'crs': dataset.crs.to_wkt() if dataset.crs else None,
+        'transform': tuple(dataset.transform)[:6],
+        # Note: as strings, so NaN nodata values compare equal
+        'nodata': tuple(str(value) for value in dataset.nodatavals),
+    }
+
+
+class Raster:
+    """A raster opened once and shared by the header, info, and value comparisons
+
+    Pixel data is read through rasterio, and the header (see `read_header`) and `gdal.Info` description used by
+    `compare.compare_raster_headers` and `compare.compare_raster_info` are computed on first use and then cached. The
+    pixel data of uncompressed, untiled GeoTIFFs whose strips are stored contiguously is exposed as a read-only
+    `np.memmap` (see `memmap`), so `read` can return it without decoding the band into a new array.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.dataset = rasterio.open(self.path)
+
+    def close(self):
+        self.dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'Raster({str(self.path)!r})'
+
+    @cached_property
+    def info(self) -> dict:
+        return gdal.Info(gdal.Open(str(self.path)), format='json')
+
+    @cached_property
+    def header(self) -> dict:
+        return read_header(self.dataset)
+
+    @property
+    def pixel_size(self) -> float:
+        return self.header['transform'][0]
+
+    def _strip_offsets(self, band: int) -> list:
+        n_strips = -(-self.dataset.height // self.dataset.block_shapes[band - 1][0])
+        offsets = [self.dataset.get_tag_item(f'BLOCK_OFFSET_0_{strip}', 'TIFF', bidx=band) for strip in range(n_strips)]
+        return [None if offset is None else int(offset) for offset in offsets]
+
+    def memmap(self, band: int = 1) -> Optional[np.memmap]:
+        """The raw pixel data of `band` as a read-only memory map, or None if it isn't stored contiguously on disk"""
+        dataset = self.dataset
+        if dataset.driver != 'GTiff' or dataset.compression is not None:
+            return None
+        if dataset.block_shapes[band - 1][1] != dataset.width:  # tiled
+            return None
+        if dataset.count > 1 and dataset.interleaving != Interleaving.band:
+            return None
+
+        try:
+            dtype = np.dtype(dataset.dtypes[band - 1])
+        except TypeError:  # e.g., complex_int16, which numpy doesn't support
+            return None
+
+        with open(self.path, 'rb') as f:
+            dtype = dtype.newbyteorder('<' if f.read(2) == b'II' else '>')
+
+        strip_size = dataset.block_shapes[band - 1][0] * dataset.width * dtype.itemsize
+        offsets = self._strip_offsets(band)
+        if None in offsets or any(offset != offsets[0] + ii * strip_size for ii, offset in enumerate(offsets)):
+            return None
+
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offsets[0], shape=(dataset.height, dataset.width))
+
+    @instrumentation.instrumented('load', arg_names=('self',))
+    def read(self, band: int = 1) -> np.ndarray:
+        """Read `band` like `xr.open_dataset(..., engine='rasterio')`: promoted to float with nodata masked by NaN
+
+        When the band is memory mapped, already floating point, and has no nodata pixels to mask, the memory map is
+        returned as-is.
+        """
+        nodata = self.dataset.nodatavals[band - 1]
+        data = self.memmap(band)
+        if data is None:
+            data = self.dataset.read(band, masked=nodata is not None)
+            return np.ma.filled(data.astype(np.result_type(data.dtype, np.float32)), np.nan)
+
+        data = data.astype(np.result_type(data.dtype, np.float32), copy=False)
+        if nodata is not None and not np.isnan(nodata) and (is_nodata := data == nodata).any():
+            data = np.where(is_nodata, np.nan, data)
+        return data
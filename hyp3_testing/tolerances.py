@@ -0,0 +1,56 @@
+"""Declarative comparison tolerances, resolved from product file names by glob pattern"""
+
+import re
+from fnmatch import translate
+from pathlib import Path
+from typing import Iterable, List, Mapping, Union
+
+from hyp3_testing import util
+
+TOLERANCES_TEMPLATE = 'golden_tolerances.json.j2'
+
+
+class ToleranceRegistry:
+    """Comparison parameters (like `rtol`/`atol`, or thresholds) for product files, by glob patterns of their names
+
+    Every pattern that matches a file name contributes its parameters, in declaration order, so specific patterns
+    (like `*_corr.tif`) can add to or override general ones (like `*.tif`). The patterns are compiled once, and each
+    distinct file name is only resolved once.
+    """
+
+    def __init__(self, tolerances: Mapping[str, Mapping[str, float]]):
+        self.tolerances = {pattern: dict(parameters) for pattern, parameters in tolerances.items()}
+        self._patterns = [(re.compile(translate(pattern)), parameters)
+                          for pattern, parameters in self.tolerances.items()]
+        self._resolved = {}
+
+    def __repr__(self):
+        # Note: used by `index.comparison_key`, so it must only depend on the tolerances
+        return f'{type(self).__name__}({self.tolerances!r})'
+
+    @classmethod
+    def from_template(cls, job_type: str, template_file: str = TOLERANCES_TEMPLATE, **kwargs) -> 'ToleranceRegistry':
+        """Load the tolerances of a job type from a (JSON) template of tolerances by job type"""
+        return cls(util.render_template(template_file, **kwargs)[job_type])
+
+    def resolve(self, file: Union[str, Path]) -> dict:
+        name = Path(file).name
+        if (parameters := self._resolved.get(name)) is None:
+            matches = [pattern_parameters for pattern, pattern_parameters in self._patterns if pattern.match(name)]
+            if not matches:
+                raise KeyError(f'No tolerance pattern matches {name}')
+            parameters = self._resolved[name] = {key: value for match in matches for key, value in match.items()}
+        return dict(parameters)
+
+    def resolve_all(self, files: Iterable[Union[str, Path]]) -> List[dict]:
+        """Resolve many files at once, reporting every file that no pattern matches"""
+        resolved, unmatched = [], []
+        for file in files:
+            try:
+                resolved.append(self.resolve(file))
+            except KeyError:
+                unmatched.append(Path(file).name)
+
+        if unmatched:
+            raise KeyError(f'No tolerance pattern matches {", ".join(unmatched)}')
+        return resolved
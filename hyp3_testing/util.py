@@ -1,6 +1,9 @@
+import copy
 import json
 import random
 import string
+from functools import lru_cache
+from typing import Dict, Iterable
 
 from jinja2 import Environment, PackageLoader, StrictUndefined, select_autoescape
 
@@ -10,7 +13,9 @@ def generate_job_name() -> str:
     return f'hyp3-testing-{hash_}'
 
 
+@lru_cache(maxsize=None)
 def get_environment() -> Environment:
+    """The package's template environment, built once; Jinja caches each template once it's compiled"""
     env = Environment(
         loader=PackageLoader('hyp3_testing', 'templates'),
         autoescape=select_autoescape(['html.j2', 'xml.j2']),
@@ -22,8 +27,21 @@ def get_environment() -> Environment:
     return env
 
 
-def render_template(template_file: str, **kwargs) -> dict:
-    env = get_environment()
-    template_file = env.get_template(template_file)
-    rendered = template_file.render(**kwargs)
+@lru_cache(maxsize=None)
+def _render_template(template_file: str, kwargs: tuple) -> dict:
+    rendered = get_environment().get_template(template_file).render(**dict(kwargs))
     return json.loads(rendered)
+
+
+def render_template(template_file: str, **kwargs) -> dict:
+    """Render a JSON template, memoized by template and (hashable) arguments; callers get their own copy"""
+    try:
+        payload = _render_template(template_file, tuple(sorted(kwargs.items())))
+    except TypeError:  # unhashable arguments
+        payload = _render_template.__wrapped__(template_file, tuple(kwargs.items()))
+    return copy.deepcopy(payload)
+
+
+def render_templates(template_files: Iterable[str], **kwargs) -> Dict[str, dict]:
+    """Render many JSON templates with the same arguments (like `render_template`), by template file"""
+    return {template_file: render_template(template_file, **kwargs) for template_file in template_files}
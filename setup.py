@@ -44,6 +44,7 @@ setup(
     extras_require={
         'develop': [
             'pytest',
+            'pytest-benchmark',
             'pytest-cov',
             'pytest-dependency',
             'pytest-timeout',
@@ -6,7 +6,10 @@ import hyp3_sdk
 import pytest
 
 from hyp3_testing import helpers
-from hyp3_testing import util
+from hyp3_testing import instrumentation
+from hyp3_testing.cache import ProductCache
+from hyp3_testing.index import ComparisonIndex
+from hyp3_testing.tolerances import ToleranceRegistry
 
 
 def pytest_addoption(parser):
@@ -22,6 +25,68 @@ def pytest_addoption(parser):
     parser.addoption(
         "--user-id", nargs='?', help="Find jobs submitted by this user to compare"
     )
+    parser.addoption(
+        "--max-workers", type=int, help="Number of processes used to compare files (default: number of CPUs)"
+    )
+    parser.addoption(
+        "--cache-dir", help="Directory to cache downloaded product files in, across test sessions"
+    )
+    parser.addoption(
+        "--cache-size", type=float, help="Maximum size of the product cache in GB (default: unlimited)"
+    )
+    parser.addoption(
+        "--incremental", action='store_true',
+        help="Skip comparing files whose contents already passed the same comparison in a previous run"
+    )
+    parser.addoption(
+        "--trace-report",
+        help="Record the time and peak memory of each stage (downloads, loading, comparisons, ...) and write them to "
+             "this file as a Chrome trace JSON report"
+    )
+    parser.addoption(
+        "--raster-size", action='append', type=int,
+        help="Width (and height) of the synthetic rasters used by the benchmarks; may be repeated (default: 1024 4096)"
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'raster_size' in metafunc.fixturenames:
+        metafunc.parametrize('raster_size', metafunc.config.getoption("--raster-size") or [1024, 4096])
+
+
+def pytest_configure(config):
+    if config.getoption("--trace-report"):
+        instrumentation.enable()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    with instrumentation.stage(item.nodeid, 'test'):
+        yield
+
+
+def pytest_sessionfinish(session):
+    if trace_report := session.config.getoption("--trace-report"):
+        instrumentation.write_chrome_trace(Path(trace_report))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    stats = helpers.HYP3_REGISTRY.stats
+    if stats:
+        terminalreporter.write_sep('-', 'HyP3 client registry')
+        terminalreporter.write_line(', '.join(f'{key}: {value}' for key, value in sorted(stats.items())))
+
+    if trace_report := config.getoption("--trace-report"):
+        terminalreporter.write_sep('-', 'stage timing')
+        stages = json.loads(Path(trace_report).read_text())['otherData']['stages']
+        for name, summary in stages.items():
+            if name.startswith('test:'):
+                continue
+            terminalreporter.write_line(
+                f'{name}: {summary["count"]} calls, {summary["seconds"]:.1f} s, '
+                f'{summary["peak_rss_mb"]:.0f} MB peak RSS'
+            )
+        terminalreporter.write_line(f'Chrome trace report written to {trace_report}')
 
 
 def pytest_collection_modifyitems(config, items):
@@ -81,6 +146,33 @@ def user_id(request):
     return request.config.getoption("--user-id")
 
 
+@pytest.fixture(scope='session')
+def max_workers(request):
+    return request.config.getoption("--max-workers")
+
+
+@pytest.fixture(scope='session')
+def product_cache(request):
+    cache_dir = request.config.getoption("--cache-dir")
+    if cache_dir is None:
+        return None
+
+    cache_size = request.config.getoption("--cache-size")
+    max_size = None if cache_size is None else int(cache_size * 1024 ** 3)
+    return ProductCache(Path(cache_dir), max_size=max_size)
+
+
+@pytest.fixture(scope='session')
+def comparison_index(request, comparison_dirs):
+    if not request.config.getoption("--incremental"):
+        yield None
+        return
+
+    index = ComparisonIndex(comparison_dirs[0].parent / 'hyp3_testing_comparisons.sqlite')
+    yield index
+    index.close()
+
+
 @pytest.fixture
 def comparison_netcdfs(tmp_path_factory, test_data_dir):
     tmp_dir = tmp_path_factory.mktemp('data')
@@ -100,23 +192,22 @@ def test_data_dir():
 
 
 @pytest.fixture(scope='module')
-def rtc_tolerances(job_name):
-    testing_parameters = util.render_template('rtc_gamma_golden.json.j2', name=job_name)
-    tolerance_names = ['_'.join(sorted(item['job_parameters']['granules'])) for item in testing_parameters]
-    backscatter_types = ['VV', 'VH', 'HH', 'HV']
-    other_types = ['inc_map', 'ls_map', 'dem']
+def rtc_tolerances():
+    return ToleranceRegistry.from_template('RTC_GAMMA')
 
-    backscatter_tolerances = {x: {'rtol': 2e-05, 'atol': 1e-05} for x in backscatter_types}
-    other_tolerances = {x: {'rtol': 0.0, 'atol': 0.0} for x in other_types}
-    specific_tolerances = {'area': {'rtol': 2e-05, 'atol': 0.0}, 'rgb': {'rtol': 0.0, 'atol': 1.0}}
 
-    tolerances = {**backscatter_tolerances, **specific_tolerances, **other_tolerances}
-    tolerance_dict = {k: tolerances for k in tolerance_names}
-    return tolerance_dict
+@pytest.fixture(scope='module')
+def insar_tolerances():
+    return ToleranceRegistry.from_template('INSAR_GAMMA')
 
 
 @pytest.fixture(scope='module')
-def jobs_info(comparison_environments, job_name, user_id):
+def burst_insar_tolerances():
+    return ToleranceRegistry.from_template('INSAR_ISCE_BURST')
+
+
+@pytest.fixture(scope='module')
+def jobs_info(comparison_environments, job_name, user_id, product_cache):
     (main_dir, main_api), (develop_dir, develop_api) = comparison_environments
     if job_name is None:
         submission_report = main_dir / f'{main_dir.name}_submission.json'
@@ -126,12 +217,17 @@ def jobs_info(comparison_environments, job_name, user_id):
     main_jobs = helpers.get_jobs_in_environment(job_name, main_api, user_id=user_id)
     develop_jobs = helpers.get_jobs_in_environment(job_name, develop_api, user_id=user_id)
 
+    job_pairs = list(zip(main_jobs, develop_jobs))
+    product_files = iter(helpers.determine_products_files(
+        [job for job_pair in job_pairs for job in job_pair], product_cache
+    ))
+
     jobs_dict = {}
-    for main_job, develop_job in zip(main_jobs, develop_jobs):
+    for main_job, develop_job in job_pairs:
         pair_name = '_'.join(sorted(main_job.job_parameters['granules']))
 
-        job_main_dir, main_normalized_files = helpers.determine_product_files(main_job)
-        job_develop_dir, develop_normalized_files = helpers.determine_product_files(develop_job)
+        job_main_dir, main_normalized_files = next(product_files)
+        job_develop_dir, develop_normalized_files = next(product_files)
 
         jobs_dict[pair_name] = {
             'main': {
@@ -1,5 +1,5 @@
+import importlib.util
 import json
-import os
 from pathlib import Path
 from pprint import pformat
 
@@ -13,6 +13,9 @@ from hyp3_testing import util
 
 pytestmark = pytest.mark.golden
 
+# chunk the products with dask, if it's available
+CHUNKS = {} if importlib.util.find_spec('dask') else None
+
 
 @pytest.mark.nameskip
 def test_golden_submission(its_live_environments):
@@ -24,7 +27,7 @@ def test_golden_submission(its_live_environments):
     for dir_, api in its_live_environments:
         dir_.mkdir(parents=True, exist_ok=True)
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+        hyp3 = helpers.get_hyp3(api)
         jobs = hyp3.submit_prepared_jobs(submission_payload)
         request_time = jobs.jobs[0].request_time.isoformat(timespec='seconds')
         print(f'{dir_.name} request time: {request_time}')
@@ -37,9 +40,13 @@ def test_golden_submission(its_live_environments):
 @pytest.mark.timeout(10800)  # 3 hours
 @pytest.mark.dependency()
 def test_golden_wait(its_live_environments, job_name, user_id):
+    environments = []
     for dir_, api in its_live_environments:
+        hyp3 = helpers.get_hyp3(api)
+
         products = helpers.find_products(dir_, pattern='*.nc')
         if products:
+            environments.extend([hyp3, []])
             continue
 
         if job_name is None:
@@ -47,16 +54,17 @@ def test_golden_wait(its_live_environments, job_name, user_id):
             submission_details = json.loads(submission_report.read_text())
             job_name = submission_details['name']
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
         jobs = hyp3.find_jobs(name=job_name, user_id=user_id)
 
         assert len(jobs) > 0  # will throw if job_name not associated with user_id
 
-        _ = hyp3.watch(jobs)
+        environments.extend([hyp3, helpers.sort_jobs_by_parameters(jobs)])
+
+    _ = helpers.watch_environments(*environments)
 
 
 @pytest.mark.dependency(depends=['test_golden_wait'])
-def test_golden_products(its_live_environments, job_name, user_id, keep):
+def test_golden_products(its_live_environments, job_name, user_id, keep, product_cache):
     (main_dir, main_api), (develop_dir, develop_api) = its_live_environments
     if job_name is None:
         submission_report = main_dir / f'{main_dir.name}_submission.json'
@@ -88,8 +96,8 @@ def test_golden_products(its_live_environments, job_name, user_id, keep):
         if main_job.failed() or develop_job.failed():
             continue
 
-        main_product = main_job.download_files(main_dir)[0]
-        develop_product = develop_job.download_files(develop_dir)[0]
+        main_product = helpers.download_product(main_job, main_dir, product_cache)
+        develop_product = helpers.download_product(develop_job, develop_dir, product_cache)
         if keep:  # always used in local testing
             _ = hyp3_sdk.util.download_file(main_job.browse_images[0], main_product.with_suffix('.png'))
             _ = hyp3_sdk.util.download_file(develop_job.browse_images[0], develop_product.with_suffix('.png'))
@@ -105,25 +113,34 @@ def test_golden_products(its_live_environments, job_name, user_id, keep):
         try:
             compare.bit_for_bit(main_product, develop_product)
         except compare.ComparisonFailure as b4b_failure:
-            main_ds = xr.load_dataset(main_product)
-            develop_ds = xr.load_dataset(develop_product)
+            # report structural differences from the netCDF headers alone, before reading any data
+            # Note: a header difference also fails the identical check below, which counts the failure
             try:
-                xr.testing.assert_identical(main_ds, develop_ds)
-            except AssertionError as identical_failure:
-                xr_msg = helpers.clarify_xr_message(str(identical_failure))
-                failure_count += 1
-                messages.append(f'{comparison_header}\n{xr_msg}')
-
-                try:
-                    compare.values_are_close(main_ds, develop_ds)
-                except compare.ComparisonFailure as value_failure:
-                    messages.append(str(value_failure))
+                compare.compare_netcdf_headers(main_product, develop_product)
+            except compare.ComparisonFailure as header_failure:
+                messages.append(f'{comparison_header}\n{header_failure}')
 
+            # Note: open the products lazily, in their native netCDF chunks, so they're compared in bounded memory
+            with (xr.open_dataset(main_product, chunks=CHUNKS) as main_ds,
+                  xr.open_dataset(develop_product, chunks=CHUNKS) as develop_ds):
                 try:
-                    compare.compare_cf_spatial_reference(main_ds, develop_ds)
-                except compare.ComparisonFailure as spatial_ref_failure:
-                    messages.append(str(spatial_ref_failure))
-                continue
+                    xr.testing.assert_identical(main_ds, develop_ds)
+                except AssertionError as identical_failure:
+                    xr_msg = helpers.clarify_xr_message(str(identical_failure))
+                    failure_count += 1
+                    messages.append(f'{comparison_header}\n{xr_msg}')
+
+                    try:
+                        difference_map = helpers.difference_map_path(develop_dir, develop_product)
+                        compare.values_are_close(main_ds, develop_ds, difference_map=difference_map)
+                    except compare.ComparisonFailure as value_failure:
+                        messages.append(str(value_failure))
+
+                    try:
+                        compare.compare_cf_spatial_reference(main_ds, develop_ds)
+                    except compare.ComparisonFailure as spatial_ref_failure:
+                        messages.append(str(spatial_ref_failure))
+                    continue
 
             failure_count += 1
             messages.append(f'{comparison_header}\n{b4b_failure}')  # not b4b, but identical
@@ -0,0 +1,149 @@
+import tracemalloc
+from functools import lru_cache
+
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.transform import from_origin
+
+from hyp3_testing import compare
+
+pytest.importorskip('pytest_benchmark')
+
+pytestmark = pytest.mark.benchmark
+
+DTYPES = ['float32', 'complex64']
+NAN_FRACTIONS = [0.0, 0.2]
+
+
+@lru_cache(maxsize=2)
+def _synthetic_pair(size: int, dtype: str, nan_fraction: float):
+    """A reproducible pair of rasters: the same smooth field with independent noise and a shared nodata mask"""
+    rng = np.random.default_rng(size)
+    y, x = np.ogrid[:size, :size]
+    field = (np.sin(x / 37.0) + np.cos(y / 53.0)).astype(np.float32)
+    nodata = rng.random((size, size), dtype=np.float32) < nan_fraction
+
+    pair = []
+    for _ in range(2):
+        data = field + 0.05 * rng.standard_normal((size, size), dtype=np.float32)
+        if dtype == 'complex64':
+            data = data + 1j * (field.T + 0.05 * rng.standard_normal((size, size), dtype=np.float32))
+        data = data.astype(dtype)
+        data[nodata] = np.nan
+        pair.append(data)
+    return tuple(pair)
+
+
+def _real(data: np.ndarray) -> np.ndarray:
+    # Note: the coherence (corr) threshold is only meaningful for real rasters
+    return data.real if np.iscomplexobj(data) else data
+
+
+def _benchmark(benchmark, function, *args, pixels: int, rounds: int = 3, **kwargs):
+    """Time `function`, recording its peak (traced) memory and throughput in the benchmark's extra info"""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+    benchmark.extra_info['peak_memory_mb'] = peak / 2 ** 20
+    if benchmark.stats:  # None with --benchmark-disable
+        benchmark.extra_info['megapixels_per_second'] = pixels / 1e6 / benchmark.stats.stats.mean
+
+
+@pytest.fixture(params=DTYPES)
+def dtype(request):
+    return request.param
+
+
+@pytest.fixture(params=NAN_FRACTIONS)
+def nan_fraction(request):
+    return request.param
+
+
+@pytest.fixture
+def raster_pair(raster_size, dtype, nan_fraction):
+    return _synthetic_pair(raster_size, dtype, nan_fraction)
+
+
+@pytest.fixture
+def raster_files(tmp_path, raster_pair):
+    files = []
+    for name, data in zip(['reference.tif', 'secondary.tif'], raster_pair):
+        profile = dict(driver='GTiff', height=data.shape[0], width=data.shape[1], count=1, dtype=data.dtype,
+                       transform=from_origin(0, 0, 30, 30))
+        with rasterio.open(tmp_path / name, 'w', **profile) as dataset:
+            dataset.write(data, 1)
+        files.append(tmp_path / name)
+    return files
+
+
+def test_benchmark_values_are_close(benchmark, raster_pair):
+    reference, secondary = (xr.DataArray(data) for data in raster_pair)
+    _benchmark(benchmark, compare.values_are_close, reference, secondary, atol=1.0, pixels=reference.size)
+
+
+def _masked_difference_statistics(reference, secondary, atol):
+    # Note: the full-array masked computation `compare._array_message` used before `compare._difference_statistics`
+    diff = np.ma.masked_invalid(reference - secondary)
+    n_different = diff.size - np.isclose(diff.filled(0.0), 0.0, atol=atol).sum()
+    return n_different, (diff.max(), diff.min(), diff.mean(), diff.std(), diff.var())
+
+
+@pytest.mark.parametrize('kernel', ['chunked', 'masked'])
+def test_benchmark_difference_statistics(benchmark, raster_pair, kernel):
+    function = compare._difference_statistics if kernel == 'chunked' else _masked_difference_statistics
+    _benchmark(benchmark, function, *raster_pair, atol=1.0, pixels=raster_pair[0].size)
+
+
+def test_benchmark_raster_values_are_close(benchmark, raster_files, raster_pair):
+    _benchmark(benchmark, compare.raster_values_are_close, *raster_files, atol=1.0, pixels=raster_pair[0].size)
+
+
+def test_benchmark_compute_raster_statistics(benchmark, raster_pair):
+    _benchmark(benchmark, compare.compute_raster_statistics, *raster_pair, pixels=raster_pair[0].size)
+
+
+@pytest.mark.parametrize('method', ['exact', 'histogram', 'subsample'])
+def test_benchmark_values_are_within_statistic(benchmark, raster_pair, method):
+    reference, secondary = raster_pair
+    _benchmark(benchmark, compare.values_are_within_statistic, reference, secondary, confidence_level=0.99,
+               method=method, pixels=reference.size)
+
+
+@pytest.mark.parametrize('method', ['gradshift', 'fft_correlation'])
+def test_benchmark_images_are_within_offset_threshold(benchmark, raster_pair, method):
+    reference, secondary = raster_pair
+    _benchmark(benchmark, compare.images_are_within_offset_threshold, reference, secondary, pixel_size=30,
+               offset_threshold=5.0, method=method, pixels=reference.size)
+
+
+def test_benchmark_mask_nodata_and_corr_thresholds(benchmark, raster_pair):
+    reference, secondary = (_real(data) for data in raster_pair)
+
+    def thresholds():
+        compare.maskes_are_within_similarity_threshold(reference, secondary, mask_rate=0.98)
+        compare.nodata_count_change_are_within_threshold(reference, secondary, threshold=0.01)
+        compare.corr_average_decrease_within_threshold(reference, secondary, threshold=0.05)
+
+    _benchmark(benchmark, thresholds, pixels=reference.size)
+
+
+def test_benchmark_bit_for_bit(benchmark, raster_files, raster_pair):
+    reference, _ = raster_files
+
+    def uncached_bit_for_bit():
+        compare._DIGESTS.clear()
+        compare.bit_for_bit(reference, reference)
+
+    _benchmark(benchmark, uncached_bit_for_bit, pixels=raster_pair[0].size)
+
+
+def test_benchmark_compare_raster_info(benchmark, raster_files, raster_pair):
+    reference, _ = raster_files
+    _benchmark(benchmark, compare.compare_raster_info, reference, reference, pixels=raster_pair[0].size)
@@ -0,0 +1,75 @@
+import os
+import zlib
+
+from hyp3_testing import cache
+
+
+def test_crc32(tmp_path):
+    file = tmp_path / 'file.txt'
+    file.write_bytes(b'hello' * 1000)
+    assert cache.crc32(file) == zlib.crc32(b'hello' * 1000)
+
+
+def test_link_or_copy(tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text('hello')
+
+    target = tmp_path / 'a' / 'b' / 'target.txt'
+    cache.link_or_copy(source, target)
+    assert target.read_text() == 'hello'
+
+    source.write_text('goodbye')
+    cache.link_or_copy(source, target)
+    assert target.read_text() == 'goodbye'
+
+
+def test_product_cache(tmp_path):
+    product_cache = cache.ProductCache(tmp_path / 'cache')
+
+    assert product_cache.get_listing('job1') is None
+    listing = {'filename': 'product.zip', 'members': []}
+    assert product_cache.put_listing('job1', listing) == listing
+    assert product_cache.get_listing('job1') == listing
+
+    source = tmp_path / 'product.tif'
+    source.write_bytes(b'data')
+    assert product_cache.get('job1', 'product/product.tif') is None
+
+    cached = product_cache.put('job1', 'product/product.tif', source)
+    assert cached == tmp_path / 'cache' / 'job1' / 'product' / 'product.tif'
+    assert product_cache.get('job1', 'product/product.tif') == cached
+    assert product_cache.get('job1', 'product/product.tif', size=4, crc=zlib.crc32(b'data')) == cached
+    assert product_cache.get('job1', 'product/product.tif', size=5) is None
+    assert product_cache.get('job1', 'product/product.tif', crc=0) is None
+    assert product_cache.get('job2', 'product/product.tif') is None
+    assert product_cache.size() == 4
+
+    cached.unlink()
+    cached.write_bytes(b'dat4')
+    assert product_cache.get('job1', 'product/product.tif') is None
+    assert not cached.exists()
+
+
+def test_product_cache_eviction(tmp_path):
+    product_cache = cache.ProductCache(tmp_path / 'cache', max_size=10)
+
+    for ii in range(3):
+        source = tmp_path / f'{ii}.tif'
+        source.write_bytes(b'1234')
+        product_cache.put(f'job{ii}', source.name, source)
+        os.utime(product_cache.directory / f'job{ii}' / source.name, ns=(ii * 10 ** 9, ii * 10 ** 9))
+
+    # the third file pushed the cache over its size, but was the most recently used
+    assert product_cache.size() == 8
+    assert product_cache.get('job0', '0.tif') is None
+    assert product_cache.get('job1', '1.tif') is not None
+    assert product_cache.get('job2', '2.tif') is not None
+
+    # job1's file was just used, so job2's is evicted next
+    os.utime(product_cache.directory / 'job2' / '2.tif', ns=(0, 0))
+    source = tmp_path / '3.tif'
+    source.write_bytes(b'1234')
+    product_cache.put('job3', source.name, source)
+    assert product_cache.get('job2', '2.tif') is None
+    assert product_cache.get('job1', '1.tif') is not None
+    assert product_cache.get('job3', '3.tif') is not None
@@ -1,7 +1,18 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
 import pytest
+import rasterio
 import xarray as xr
+from rasterio.transform import from_origin
+from scipy import ndimage, stats
 
 from hyp3_testing import compare
+from hyp3_testing.index import ComparisonIndex, comparison_key
+from hyp3_testing.raster import Raster
 
 ALAKSA_ALBERS_WKT = 'PROJCS["NAD83 / Alaska Albers",GEOGCS["NAD83",DATUM["North_American_Datum_1983",SPHEROID["GRS 1980",6378137,298.257222101,AUTHORITY["EPSG","7019"]],TOWGS84[0,0,0,0,0,0,0],AUTHORITY["EPSG","6269"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4269"]],PROJECTION["Albers_Conic_Equal_Area"],PARAMETER["standard_parallel_1",55],PARAMETER["standard_parallel_2",65],PARAMETER["latitude_of_center",50],PARAMETER["longitude_of_center",-154],PARAMETER["false_easting",0],PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],AXIS["X",EAST],AXIS["Y",NORTH],AUTHORITY["EPSG","3338"]]'  # noqa: E501
 
@@ -24,6 +35,287 @@ def test_bit_for_bit(tmp_path):
         compare.bit_for_bit(ref_file, sec_file)
 
 
+def test_file_digest(tmp_path, monkeypatch):
+    file = tmp_path / 'file.txt'
+    file.write_text('hello')
+    digest = compare.file_digest(file)
+    assert digest == compare.file_digest(tmp_path / '.' / 'file.txt')
+
+    # recently modified files are not memoized
+    assert not [key for key in compare._DIGESTS if key[0] == str(file.resolve())]
+
+    os.utime(file, ns=(0, 0))
+    assert compare.file_digest(file) == digest
+    assert (str(file.resolve()), 5, 0) in compare._DIGESTS
+
+    monkeypatch.setattr(compare, '_compute_digest', lambda path, size: pytest.fail('File was read again'))
+    assert compare.file_digest(file) == digest
+
+    empty = tmp_path / 'empty.txt'
+    empty.touch()
+    monkeypatch.undo()
+    assert compare.file_digest(empty) != digest
+
+    # files of different sizes are never read
+    monkeypatch.setattr(compare, '_compute_digest', lambda path, size: pytest.fail('File was read'))
+    with pytest.raises(compare.ComparisonFailure):
+        compare.bit_for_bit(file, empty)
+
+
+def test_run_comparisons(tmp_path):
+    file_pairs = []
+    for ii in range(5):
+        ref_file = tmp_path / f'ref_{ii}.txt'
+        ref_file.write_text('hello')
+        sec_file = tmp_path / f'sec_{ii}.txt'
+        sec_file.write_text('hello' if ii % 2 else 'hell0')
+        file_pairs.append((ref_file, sec_file))
+
+    messages = compare.run_comparisons(compare.bit_for_bit, file_pairs, max_workers=2)
+    assert len(messages) == 3
+    for message, (ref_file, sec_file) in zip(messages, file_pairs[::2]):
+        assert f'{ref_file}\n{sec_file}' in message
+        assert 'Files differ at the binary level' in message
+
+    assert compare.run_comparisons(compare.bit_for_bit, file_pairs[1::2]) == []
+    assert compare.run_comparisons(compare.bit_for_bit, []) == []
+
+
+_HELD_LOCK = threading.Lock()
+
+
+def _compare_with_lock(reference, secondary):
+    # a forked worker would inherit the lock while it's held by the parent, and never acquire it
+    if not _HELD_LOCK.acquire(timeout=10):
+        raise compare.ComparisonFailure('Lock inherited from the parent process')
+    _HELD_LOCK.release()
+
+
+def test_run_comparisons_not_forked(tmp_path):
+    ref_file = tmp_path / 'ref.txt'
+    ref_file.write_text('hello')
+
+    with compare.comparison_pool(max_workers=2) as pool:
+        assert pool._mp_context.get_start_method() != 'fork'
+
+        with _HELD_LOCK:
+            assert compare.run_comparisons(_compare_with_lock, [(ref_file, ref_file)] * 2, pool=pool) == []
+        assert compare.run_comparisons(compare.bit_for_bit, [(ref_file, ref_file)], pool=pool) == []
+
+
+def test_run_comparisons_incremental(tmp_path):
+    file_pairs = []
+    for ii in range(4):
+        ref_file = tmp_path / f'ref_{ii}.txt'
+        ref_file.write_text(f'hello {ii}')
+        sec_file = tmp_path / f'sec_{ii}.txt'
+        sec_file.write_text(f'hello {ii}' if ii % 2 else 'hell0')
+        file_pairs.append((ref_file, sec_file))
+
+    comparison_index = ComparisonIndex(tmp_path / 'comparisons.sqlite')
+    key = comparison_key(compare.bit_for_bit)
+
+    assert len(compare.run_comparisons(compare.bit_for_bit, file_pairs, index=comparison_index)) == 2
+    for ii, (ref_file, sec_file) in enumerate(file_pairs):
+        verdict = comparison_index.get(key, compare.file_digest(ref_file), compare.file_digest(sec_file))
+        assert verdict is bool(ii % 2)
+
+    # failed pairs are compared again
+    assert len(compare.run_comparisons(compare.bit_for_bit, file_pairs, index=comparison_index)) == 2
+
+    # pairs that already passed are skipped
+    ref_file, sec_file = file_pairs[0]
+    comparison_index.put(key, compare.file_digest(ref_file), compare.file_digest(sec_file), passed=True)
+    messages = compare.run_comparisons(compare.bit_for_bit, file_pairs, index=comparison_index)
+    assert len(messages) == 1
+    assert str(file_pairs[2][0]) in messages[0]
+
+
+def test_compute_raster_statistics():
+    reference = np.array([[1.0, 2.0, np.nan], [4.0, np.inf, 6.0]], dtype=np.float32)
+    secondary = np.array([[1.0, np.nan, np.nan], [4.0, 5.0, 8.0]], dtype=np.float32)
+
+    statistics = compare.compute_raster_statistics(reference, secondary)
+    assert statistics.valid.tolist() == [[True, False, False], [True, False, True]]
+    assert statistics.reference_nodata_count == 2
+    assert statistics.secondary_nodata_count == 2
+    assert statistics.valid_and_count == 3
+    assert statistics.valid_or_count == 5
+    assert statistics.reference_mean == pytest.approx(np.ma.masked_invalid(reference).mean())
+    assert statistics.secondary_mean == pytest.approx(np.ma.masked_invalid(secondary).mean())
+
+
+@pytest.mark.parametrize('use_statistics', [False, True])
+def test_mask_nodata_and_corr_thresholds(use_statistics):
+    reference = np.full((100, 100), 0.8, dtype=np.float32)
+    reference[:10] = np.nan
+    secondary = reference.copy()
+
+    def statistics(ref, sec):
+        return compare.compute_raster_statistics(ref, sec) if use_statistics else None
+
+    compare.maskes_are_within_similarity_threshold(
+        reference, secondary, mask_rate=0.98, statistics=statistics(reference, secondary)
+    )
+    compare.nodata_count_change_are_within_threshold(
+        reference, secondary, threshold=0.01, statistics=statistics(reference, secondary)
+    )
+    compare.corr_average_decrease_within_threshold(
+        reference, secondary, threshold=0.05, statistics=statistics(reference, secondary)
+    )
+
+    secondary[10:15] = np.nan
+    secondary *= 0.9
+    with pytest.raises(compare.ComparisonFailure, match='Two masks match with less than 0.98'):
+        compare.maskes_are_within_similarity_threshold(
+            reference, secondary, mask_rate=0.98, statistics=statistics(reference, secondary)
+        )
+    with pytest.raises(compare.ComparisonFailure, match='Number of nodata pixels'):
+        compare.nodata_count_change_are_within_threshold(
+            reference, secondary, threshold=0.01, statistics=statistics(reference, secondary)
+        )
+    with pytest.raises(compare.ComparisonFailure, match='Average spatial coherence has decreased'):
+        compare.corr_average_decrease_within_threshold(
+            reference, secondary, threshold=0.05, statistics=statistics(reference, secondary)
+        )
+
+
+@pytest.mark.parametrize('method', ['exact', 'histogram', 'subsample'])
+def test_values_are_within_statistic(method):
+    rng = np.random.default_rng(42)
+    reference = rng.normal(size=(300, 300)).astype(np.float32)
+    reference[:10] = np.nan
+    kwargs = {'method': method, 'sample_size': 10_000}
+
+    compare.values_are_within_statistic(reference, reference, confidence_level=0.99, **kwargs)
+    compare.values_are_within_statistic(reference, reference + 1e-6, confidence_level=0.99, **kwargs)
+
+    with pytest.raises(compare.ComparisonFailure) as execinfo:
+        compare.values_are_within_statistic(reference, reference + 0.1, confidence_level=0.99, **kwargs)
+    assert f'({method} KS test)' in str(execinfo.value)
+
+    with pytest.raises(ValueError):
+        compare.values_are_within_statistic(reference, reference, method='bogus')
+
+
+def test_subsample_ks_2samp_verdict():
+    rng = np.random.default_rng(42)
+    reference = rng.normal(size=200_000).astype(np.float32)
+    secondary = reference + 0.01
+
+    exact_statistic, exact_pvalue = compare._ks_2samp(reference, secondary, method='exact')
+    statistic, pvalue = compare._ks_2samp(reference, secondary, method='subsample', sample_size=20_000)
+    assert statistic == pytest.approx(exact_statistic, abs=0.01)
+    assert exact_pvalue < 0.5 and pvalue < 0.5
+
+    for method in ['exact', 'subsample']:
+        with pytest.raises(compare.ComparisonFailure):
+            compare.values_are_within_statistic(reference, secondary, confidence_level=0.5, method=method,
+                                                sample_size=20_000)
+
+
+def test_histogram_ks_2samp():
+    rng = np.random.default_rng(42)
+    reference = rng.normal(size=100_000)
+    secondary = rng.normal(loc=0.01, size=100_000)
+
+    statistic, pvalue = compare._histogram_ks_2samp(reference, secondary)
+    exact = stats.ks_2samp(reference, secondary)
+    assert statistic == pytest.approx(exact.statistic, abs=1e-3)
+    assert pvalue == pytest.approx(exact.pvalue, rel=0.1)
+
+
+def test_histogram_ks_2samp_heavy_tailed():
+    # a few outliers stretch the value range of heavy-tailed data, so equal-width bins would hold almost every pixel
+    # in a handful of bins and hide the difference
+    rng = np.random.default_rng(42)
+    reference = rng.standard_cauchy(500_000)
+    secondary = rng.standard_cauchy(500_000) * 1.02
+
+    exact = stats.ks_2samp(reference, secondary)
+    statistic, pvalue = compare._histogram_ks_2samp(reference, secondary, sample_size=100_000)
+    assert statistic == pytest.approx(exact.statistic, abs=1e-3)
+    assert exact.pvalue < 0.01 and pvalue < 0.01
+
+    for method in ['exact', 'histogram', 'subsample']:
+        with pytest.raises(compare.ComparisonFailure):
+            compare.values_are_within_statistic(reference, secondary, confidence_level=0.99, method=method,
+                                                sample_size=100_000)
+
+
+@pytest.mark.parametrize('method', ['gradshift', 'fft_correlation'])
+def test_images_are_within_offset_threshold(method):
+    rng = np.random.default_rng(42)
+    reference = ndimage.gaussian_filter(rng.normal(size=(512, 384)), 4).astype(np.float32)
+    secondary = ndimage.shift(reference, (-0.3, 0.4), order=3, mode='nearest')
+    secondary[:20, :20] = np.nan
+
+    x_shift, y_shift = compare._offset_shift(reference, secondary, method=method)
+    assert x_shift == pytest.approx(0.4, abs=0.02)
+    assert y_shift == pytest.approx(-0.3, abs=0.02)
+
+    compare.images_are_within_offset_threshold(reference, secondary, pixel_size=10, offset_threshold=6.0,
+                                               method=method)
+    with pytest.raises(compare.ComparisonFailure) as execinfo:
+        compare.images_are_within_offset_threshold(reference, secondary, pixel_size=10, offset_threshold=4.0,
+                                                   method=method)
+    assert 'Calculated offset distance (5.0' in str(execinfo.value)
+
+    with pytest.raises(ValueError):
+        compare.images_are_within_offset_threshold(reference, secondary, method='bogus')
+
+
+@pytest.mark.parametrize('method', ['gradshift', 'fft_correlation'])
+def test_images_are_within_offset_threshold_complex(method):
+    rng = np.random.default_rng(22)
+    magnitude = ndimage.gaussian_filter(rng.normal(size=(512, 384)), 4)
+    magnitude -= magnitude.min()
+    phase = rng.uniform(-np.pi, np.pi, size=magnitude.shape)
+    reference = (magnitude * np.exp(1j * phase)).astype(np.complex64)
+    secondary = (ndimage.shift(magnitude, (-0.3, 0.4), order=3, mode='nearest') * np.exp(1j * phase[::-1])).astype(
+        np.complex64
+    )
+
+    x_shift, y_shift = compare._offset_shift(reference, secondary, method=method)
+    assert x_shift == pytest.approx(0.4, abs=0.02)
+    assert y_shift == pytest.approx(-0.3, abs=0.02)
+
+    statistics = compare.compute_raster_statistics(reference, secondary)
+    compare.images_are_within_offset_threshold(reference, secondary, pixel_size=10, offset_threshold=6.0,
+                                               method=method, statistics=statistics)
+
+
+def test_values_are_within_statistic_complex():
+    rng = np.random.default_rng(22)
+    real, imaginary = rng.normal(size=(2, 300, 300)).astype(np.float32)
+    reference = real + 1j * imaginary
+    reference[:10] = np.nan
+
+    compare.values_are_within_statistic(reference, reference, confidence_level=0.99)
+    compare.values_are_within_statistic(reference, reference.conj().conj(), confidence_level=0.99,
+                                        method='histogram')
+
+    with pytest.raises(compare.ComparisonFailure, match=r'real component'):
+        compare.values_are_within_statistic(reference, reference + 0.1, confidence_level=0.99)
+    with pytest.raises(compare.ComparisonFailure, match=r'imaginary component'):
+        compare.values_are_within_statistic(reference, reference + 0.1j, confidence_level=0.99, method='histogram')
+
+
+def test_fft_correlation_shift():
+    rng = np.random.default_rng(42)
+    reference = ndimage.gaussian_filter(rng.normal(size=(1024, 768)), 2).astype(np.float32)
+    for row_shift, col_shift in [(0.0, 0.0), (-1.7, 2.3), (33.5, -60.25)]:
+        secondary = ndimage.shift(reference, (row_shift, col_shift), order=3, mode='nearest')
+        x_shift, y_shift = compare._fft_correlation_shift(reference, secondary)
+        assert x_shift == pytest.approx(col_shift, abs=0.05)
+        assert y_shift == pytest.approx(row_shift, abs=0.05)
+
+    secondary = ndimage.shift(reference[:100, :90], (1.5, -2.25), order=3, mode='nearest')
+    x_shift, y_shift = compare._fft_correlation_shift(reference[:100, :90], secondary)
+    assert x_shift == pytest.approx(-2.25, abs=0.1)
+    assert y_shift == pytest.approx(1.5, abs=0.1)
+
+
 def test_values_are_close(comparison_netcdfs):
     reference, secondary = comparison_netcdfs
 
@@ -45,6 +337,246 @@ def test_values_are_close(comparison_netcdfs):
     compare.values_are_close(ref_ds.variables['v'], sec_ds.variables['v'], atol=5.0)
 
 
+def test_dataset_message_is_sorted_and_bounded(monkeypatch):
+    rng = np.random.default_rng(0)
+    variables = {name: (('y', 'x'), rng.random((20, 30))) for name in ['vy', 'v', 'vx', 'v_error', 'vx_error']}
+    ref_ds = xr.Dataset(variables)
+    sec_ds = ref_ds + 1.0
+
+    message = compare._dataset_message(ref_ds, sec_ds)
+    names = [line.split(': ')[1] for line in message.splitlines() if line.startswith('Dataset variable')]
+    assert names == sorted(variables)
+
+    active = [0]
+    max_active = []
+    compare_values_message = compare._compare_values_message
+    lock = threading.Lock()
+
+    def tracking_message(reference, secondary, **kwargs):
+        with lock:
+            active[0] += 1
+            max_active.append(active[0])
+        try:
+            return compare_values_message(reference, secondary, **kwargs)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    monkeypatch.setattr(compare, '_compare_values_message', tracking_message)
+    assert compare._dataset_message(ref_ds, sec_ds, max_buffers=2) == message
+    assert len(max_active) == len(variables)
+    assert max(max_active) <= 2
+
+
+def _message_numbers(message):
+    return [float(number) for number in re.findall(r'-?\d+\.\d+(?:e-?\d+)?', message)]
+
+
+def test_values_are_close_chunked(comparison_netcdfs, monkeypatch):
+    dask = pytest.importorskip('dask')
+    reference, secondary = comparison_netcdfs
+
+    ref_ds = xr.load_dataset(reference)
+    sec_ds = xr.load_dataset(secondary)
+    in_memory_message = compare._compare_values_message(ref_ds, sec_ds)
+
+    computes = []
+    dask_compute = dask.compute
+
+    def counting_compute(*args, **kwargs):
+        computes.append(kwargs)
+        return dask_compute(*args, **kwargs)
+
+    monkeypatch.setattr(dask, 'compute', counting_compute)
+
+    with (xr.open_dataset(reference, chunks={'x': 50, 'y': 40}) as ref_chunked,
+          xr.open_dataset(secondary, chunks={'x': 50, 'y': 40}) as sec_chunked):
+        assert isinstance(ref_chunked.v.data, compare.da.Array)
+
+        chunked_message = compare._compare_values_message(ref_chunked, sec_chunked)
+        assert computes == [{'scheduler': 'threads'}]
+        assert chunked_message.splitlines()[:4] == in_memory_message.splitlines()[:4]
+        np.testing.assert_allclose(_message_numbers(chunked_message), _message_numbers(in_memory_message))
+
+        assert compare._compare_values_message(ref_chunked.variables['v'], sec_ds.variables['v']) is not None
+        assert compare._compare_values_message(ref_chunked.variables['v'], ref_chunked.variables['v']) is None
+
+        compare.values_are_close(ref_chunked, ref_chunked)
+        with pytest.raises(compare.ComparisonFailure, match='10,628/50,000'):
+            compare.values_are_close(ref_chunked, sec_chunked)
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64', 'complex64'])
+def test_difference_statistics(monkeypatch, dtype):
+    rng = np.random.default_rng(19)
+    reference = rng.standard_normal((300, 200)).astype(dtype)
+    secondary = (reference + rng.normal(scale=1e-3, size=reference.shape)).astype(dtype)
+    reference[::7, ::3] = np.nan
+    secondary[::5, ::11] = np.inf
+
+    monkeypatch.setattr(compare, 'DIFF_CHUNK_SIZE', 1000)
+    n_different, statistics = compare._difference_statistics(reference, secondary, atol=1e-3)
+
+    diff = np.ma.masked_invalid(reference - secondary)
+    assert n_different == diff.size - np.isclose(diff.filled(0.0), 0.0, atol=1e-3).sum()
+    assert statistics.count == diff.count()
+    assert statistics.max == diff.max()
+    assert statistics.min == diff.min()
+    assert [statistics.mean, statistics.std, statistics.var] == [diff.mean(), diff.std(), diff.var()]
+
+    n_different, _ = compare._difference_statistics(reference, np.full_like(reference, np.nan))
+    assert n_different == 0
+
+
+@pytest.mark.parametrize('dtype', ['uint8', 'int16', 'float32', 'float64'])
+def test_array_message_matches_masked_baseline(monkeypatch, dtype):
+    rng = np.random.default_rng(19)
+    reference = xr.Variable(('y', 'x'), (rng.standard_normal((513, 777)) * 100).astype(dtype))
+    secondary = xr.Variable(('y', 'x'), (rng.standard_normal((513, 777)) * 100).astype(dtype))
+    if dtype.startswith('float'):
+        reference[::7, ::3] = np.nan
+
+    # Note: the full-array masked computation `compare._array_message` used before it was chunked
+    diff = np.ma.masked_invalid(reference - secondary)
+    n_different = diff.size - np.isclose(diff.filled(0.0), 0.0).sum()
+    baseline = '\n'.join([
+        f'{n_different:,}/{diff.size:,} ({n_different / diff.size:.2%}) values are different.',
+        'Reference - secondary:',
+        f'    max {diff.max()}; min {diff.min()}; mean {diff.mean()};',
+        f'    std {diff.std()}; var {diff.var()}',
+    ])
+
+    monkeypatch.setattr(compare, 'DIFF_CHUNK_SIZE', 1000)
+    assert compare._array_message(reference, secondary) == baseline
+
+
+def _write_raster(path, data, nodata=None):
+    with rasterio.open(
+            path, 'w', driver='GTiff', width=data.shape[1], height=data.shape[0], count=1, dtype=data.dtype,
+            nodata=nodata, tiled=True, blockxsize=16, blockysize=16, transform=from_origin(0, 0, 30, 30),
+            crs='EPSG:32606',
+    ) as dataset:
+        dataset.write(data, 1)
+    return path
+
+
+def test_raster_values_are_close(tmp_path):
+    rng = np.random.default_rng(42)
+    data = rng.random((50, 40), dtype=np.float32)
+    reference = _write_raster(tmp_path / 'reference.tif', data)
+    compare.raster_values_are_close(reference, reference)
+
+    data[10:20, 5:35] += 0.5
+    secondary = _write_raster(tmp_path / 'secondary.tif', data)
+    with pytest.raises(compare.ComparisonFailure) as execinfo:
+        compare.raster_values_are_close(reference, secondary)
+    assert str(execinfo.value).startswith('Values are different.\n300/2,000 (15.00%) values are different.')
+
+    ref_ds = xr.open_dataset(reference, engine='rasterio')
+    sec_ds = xr.open_dataset(secondary, engine='rasterio')
+    in_memory_message = compare._compare_values_message(ref_ds.band_data, sec_ds.band_data)
+    assert str(execinfo.value).splitlines()[1:3] == in_memory_message.splitlines()[:2]
+
+    compare.raster_values_are_close(reference, secondary, atol=0.5)
+
+    nodata = _write_raster(tmp_path / 'nodata.tif', np.zeros((50, 40), dtype=np.float32), nodata=0)
+    compare.raster_values_are_close(nodata, nodata)
+
+    with pytest.raises(compare.ComparisonFailure) as execinfo:
+        compare.raster_values_are_close(reference, _write_raster(tmp_path / 'small.tif', data[:-2]))
+    assert 'Data arrays are different shapes' in str(execinfo.value)
+
+    complex_data = (data + 1j * data[::-1]).astype(np.complex64)
+    complex_reference = _write_raster(tmp_path / 'complex_reference.tif', complex_data)
+    compare.raster_values_are_close(complex_reference, complex_reference)
+
+    complex_data[:10] += 1j
+    complex_secondary = _write_raster(tmp_path / 'complex_secondary.tif', complex_data)
+    with pytest.raises(compare.ComparisonFailure) as execinfo:
+        compare.raster_values_are_close(complex_reference, complex_secondary)
+    assert str(execinfo.value).startswith('Values are different.\n400/2,000 (20.00%) values are different.')
+
+
+def test_tile_differences():
+    rng = np.random.default_rng(21)
+    reference = rng.normal(size=(300, 200)).astype(np.float32)
+    secondary = reference.copy()
+    secondary[150:200, 140:180] += 2.0
+    reference[:128, :128] = np.nan
+    secondary[:128, :128] = np.nan
+
+    differences = compare.tile_differences(reference, secondary, tile_size=128)
+    assert differences.tile_size == 128
+    assert differences.mismatch_fraction.shape == (1, 3, 2)
+
+    hot = np.zeros((1, 3, 2), dtype=bool)
+    hot[0, 1, 1] = True
+    np.testing.assert_array_equal(differences.mismatch_fraction > 0, hot)
+    assert differences.mismatch_fraction[0, 1, 1] == 50 * 40 / (128 * 72)
+    assert differences.max_abs_diff[0, 1, 1] == pytest.approx(2.0)
+    assert differences.ks_statistic[0, 1, 1] > differences.ks_statistic[0, 1, 0] == 0.0
+    assert np.isnan(differences.max_abs_diff[0, 0, 0]) and np.isnan(differences.ks_statistic[0, 0, 0])
+
+
+def test_difference_maps(tmp_path, comparison_netcdfs):
+    rng = np.random.default_rng(21)
+    data = rng.random((300, 200), dtype=np.float32)
+    reference = _write_raster(tmp_path / 'reference.tif', data)
+    data[260:, :20] += 1.0
+    secondary = _write_raster(tmp_path / 'secondary.tif', data)
+
+    with pytest.raises(compare.ComparisonFailure, match='Tile differences written to'):
+        compare.raster_values_are_close(reference, secondary, difference_map=tmp_path / 'raster.npz')
+    with np.load(tmp_path / 'raster.npz') as difference_map:
+        assert difference_map['tile_size'] == compare.TILE_SIZE
+        assert tuple(difference_map['transform']) == (30 * 256, 0, 0, 0, -30 * 256, 0)
+        np.testing.assert_array_equal(difference_map['mismatch_fraction'] > 0, [[[False], [True]]])
+
+    with pytest.raises(compare.ComparisonFailure, match='Tile differences written to'):
+        compare.values_are_within_statistic(data, data + 0.1, confidence_level=0.99,
+                                            difference_map=tmp_path / 'statistic.npz')
+    with np.load(tmp_path / 'statistic.npz') as difference_map:
+        assert difference_map['ks_statistic'].shape == (1, 2, 1)
+        assert 'transform' not in difference_map
+
+    ref_ds = xr.load_dataset(comparison_netcdfs[0])
+    sec_ds = xr.load_dataset(comparison_netcdfs[1])
+    with pytest.raises(compare.ComparisonFailure, match='Tile differences written to'):
+        compare.values_are_close(ref_ds, sec_ds, difference_map=tmp_path / 'dataset.npz')
+    with np.load(tmp_path / 'dataset.npz') as difference_map:
+        assert difference_map['v/mismatch_fraction'].max() > 0
+        assert not any(name.startswith('Polar_Stereographic/') for name in difference_map)
+
+
+def test_variable_tile_differences_chunked(comparison_netcdfs, monkeypatch):
+    pytest.importorskip('dask')
+    reference, secondary = comparison_netcdfs
+
+    ref_ds = xr.load_dataset(reference)
+    sec_ds = xr.load_dataset(secondary)
+    in_memory = compare._variable_tile_differences(ref_ds, sec_ds, tile_size=64)
+
+    tile_shapes = set()
+    tile_summary = compare._tile_summary
+
+    def recording_tile_summary(reference, secondary, **kwargs):
+        assert isinstance(reference, np.ndarray) and isinstance(secondary, np.ndarray)
+        tile_shapes.add(reference.shape)
+        return tile_summary(reference, secondary, **kwargs)
+
+    monkeypatch.setattr(compare, '_tile_summary', recording_tile_summary)
+
+    with (xr.open_dataset(reference, chunks={'x': 50, 'y': 40}) as ref_chunked,
+          xr.open_dataset(secondary, chunks={'x': 50, 'y': 40}) as sec_chunked):
+        chunked = compare._variable_tile_differences(ref_chunked, sec_chunked, tile_size=64)
+
+    assert max(max(shape) for shape in tile_shapes) == 64
+    assert chunked.keys() == in_memory.keys()
+    for name, differences in in_memory.items():
+        for field in ('mismatch_fraction', 'max_abs_diff', 'ks_statistic'):
+            np.testing.assert_array_equal(getattr(chunked[name], field), getattr(differences, field))
+
+
 def test_compare_values_message(comparison_netcdfs):
     reference, secondary = comparison_netcdfs
 
@@ -104,6 +636,42 @@ def test_compare_cf_spatial_reference(comparison_netcdfs):
     assert 'Spatial references are not the same' in str(execinfo.value)
 
 
+def test_compare_raster_headers(tmp_path, monkeypatch):
+    data = np.ones((64, 48), dtype=np.float32)
+    reference = _write_raster(tmp_path / 'reference.tif', data)
+    same = _write_raster(tmp_path / 'same.tif', data)
+    transposed = _write_raster(tmp_path / 'transposed.tif', data.T.copy())
+    nodata = _write_raster(tmp_path / 'nodata.tif', data, nodata=np.nan)
+
+    old = time.time_ns() - 2 * compare.RACY_INTERVAL_NS
+    for path in (reference, same, transposed, nodata):
+        os.utime(path, ns=(old, old))
+
+    compare.compare_raster_headers(reference, same)
+    compare.compare_raster_headers(nodata, nodata)
+    with pytest.raises(compare.ComparisonFailure, match=r'shape: reference \(1, 64, 48\); secondary \(1, 48, 64\)'):
+        compare.compare_raster_headers(reference, transposed)
+    with pytest.raises(compare.ComparisonFailure, match='nodata'):
+        compare.compare_raster_headers(reference, nodata)
+
+    monkeypatch.setattr(compare.rasterio, 'open', None)  # headers are memoized, so files aren't reopened
+    compare.compare_raster_headers(reference, same)
+
+
+def test_compare_netcdf_headers(comparison_netcdfs, tmp_path):
+    reference, secondary = comparison_netcdfs
+    compare.compare_netcdf_headers(reference, secondary)
+
+    with xr.open_dataset(secondary) as sec_ds:
+        compare.compare_netcdf_headers(reference, sec_ds)
+
+        with pytest.raises(compare.ComparisonFailure, match='variable v: reference'):
+            compare.compare_netcdf_headers(reference, sec_ds.drop_vars('v'))
+
+        with pytest.raises(compare.ComparisonFailure, match='dimension x'):
+            compare.compare_netcdf_headers(reference, sec_ds.isel(x=slice(1, None)))
+
+
 def test_compare_raster_info(test_data_dir):
     a = test_data_dir / 'dem_nodata_0.tif'
     b = test_data_dir / 'dem_nodata_1.tif'
@@ -112,6 +680,12 @@ def test_compare_raster_info(test_data_dir):
     with pytest.raises(compare.ComparisonFailure):
         compare.compare_raster_info(a, b)
 
+    with Raster(a) as raster_a, Raster(b) as raster_b:
+        compare.compare_raster_info(raster_a, a)
+        compare.compare_raster_info(raster_a, raster_a)
+        with pytest.raises(compare.ComparisonFailure):
+            compare.compare_raster_info(raster_a, raster_b)
+
 
 def test_find_grid_mapping_variable_name(comparison_netcdfs):
     reference, _ = comparison_netcdfs
@@ -1,4 +1,18 @@
+import asyncio
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import numpy as np
+import pytest
+from hyp3_sdk import HyP3, Job
+from hyp3_sdk.exceptions import HyP3Error
+
+from hyp3_testing import compare
 from hyp3_testing import helpers
+from hyp3_testing.cache import ProductCache
 
 
 def test_find_products(tmp_path):
@@ -36,3 +50,315 @@ def test_find_files_in_products(tmp_path):
         (main_dir / 'b.tif', develop_dir / 'b.tif'),
         (main_dir / 'c.tif', develop_dir / 'c.tif'),
     ]
+
+
+def test_extract_members(tmp_path):
+    product_zip = tmp_path / 'product_HASH.zip'
+    with ZipFile(product_zip, 'w') as zip_:
+        zip_.writestr('product_HASH/', '')
+        for f in ['product_HASH_VV.tif', 'product_HASH_VH.tif', 'product_HASH.png', 'product_HASH.README.md.txt']:
+            zip_.writestr(f'product_HASH/{f}', f)
+
+    with ZipFile(product_zip) as zip_:
+        extracted = helpers.extract_members(zip_, tmp_path / 'tifs', member_filter='*.tif')
+    assert extracted == [tmp_path / 'tifs' / 'product_HASH' / f for f in ['product_HASH_VV.tif', 'product_HASH_VH.tif']]
+    assert sorted((tmp_path / 'tifs' / 'product_HASH').iterdir()) == sorted(extracted)
+    assert extracted[0].read_text() == 'product_HASH_VV.tif'
+
+    with ZipFile(product_zip) as zip_:
+        extracted = helpers.extract_members(zip_, tmp_path / 'all')
+    assert len(extracted) == 4
+
+
+def test_extract_zip_files(tmp_path, monkeypatch):
+    zip_files = []
+    for product in ['product_A', 'product_B']:
+        zip_files.append(tmp_path / f'{product}.zip')
+        with ZipFile(zip_files[-1], 'w', compression=ZIP_DEFLATED) as zip_:
+            zip_.writestr(f'{product}/', '')
+            for suffix in ['VV.tif', 'VH.tif', 'README.md.txt']:
+                zip_.writestr(f'{product}/{product}_{suffix}', f'{product}_{suffix}' * 1000)
+
+    extracted = helpers.extract_zip_files(zip_files, member_filter='*.tif', max_workers=4)
+    assert extracted == [tmp_path / product / f'{product}_{suffix}'
+                         for product in ['product_A', 'product_B'] for suffix in ['VV.tif', 'VH.tif']]
+    assert extracted[3].read_text() == 'product_B_VH.tif' * 1000
+    assert not list(tmp_path.rglob('*.partial'))
+
+    extracted[0].write_text('corrupt')
+    opened = []
+    zip_open = ZipFile.open
+
+    def tracking_open(self, member, *args, **kwargs):
+        opened.append(member.filename)
+        return zip_open(self, member, *args, **kwargs)
+
+    monkeypatch.setattr(ZipFile, 'open', tracking_open)
+    assert helpers.extract_zip_files(zip_files, member_filter='*.tif') == extracted
+    assert opened == ['product_A/product_A_VV.tif']
+    assert extracted[0].read_text() == 'product_A_VV.tif' * 1000
+
+    assert len(helpers.extract_zip_files(zip_files)) == 6
+
+    with ZipFile(tmp_path / 'evil.zip', 'w') as zip_:
+        zip_.writestr('../evil.tif', 'evil')
+    with pytest.raises(ValueError):
+        helpers.extract_zip_files([tmp_path / 'evil.zip'])
+
+
+def test_fetch_cached_product(tmp_path, monkeypatch):
+    product_zip = tmp_path / 'product_HASH.zip'
+    members = {'product_HASH/product_HASH_VV.tif': b'VV', 'product_HASH/product_HASH.png': b'png'}
+    with ZipFile(product_zip, 'w') as zip_:
+        zip_.writestr('product_HASH/', '')
+        for name, content in members.items():
+            zip_.writestr(name, content)
+
+    product_cache = ProductCache(tmp_path / 'cache')
+    product_cache.put_listing('job', {
+        'filename': product_zip.name,
+        'url': str(product_zip),
+        'members': [{'filename': 'product_HASH/', 'size': 0, 'crc': 0}] + [
+            {'filename': name, 'size': len(content), 'crc': zlib.crc32(content)} for name, content in members.items()
+        ],
+    })
+
+    opened = []
+
+    def mock_remote_zip(url):
+        opened.append(url)
+        return ZipFile(url)
+
+    monkeypatch.setattr(helpers, 'RemoteZip', mock_remote_zip)
+
+    for expected_opened in (1, 1):
+        product_dir, members = helpers._fetch_product('job', 'api', tmp_path / 'main', cache=product_cache)
+        assert product_dir == tmp_path / 'main' / 'product_HASH'
+        assert members == [product_dir / 'product_HASH_VV.tif']
+        assert list(product_dir.iterdir()) == [product_dir / 'product_HASH_VV.tif']
+        assert (product_dir / 'product_HASH_VV.tif').read_bytes() == b'VV'
+        assert len(opened) == expected_opened
+        helpers._remove_product(product_dir)
+
+    assert product_cache.get('job', 'product_HASH/product_HASH_VV.tif') is not None
+    assert product_cache.get('job', 'product_HASH/product_HASH.png') is None
+
+
+def test_fetch_product_resumes_partial_extraction(tmp_path, monkeypatch):
+    product_zip = tmp_path / 'product_HASH.zip'
+    members = {'product_HASH/product_HASH_VV.tif': b'VV' * 100, 'product_HASH/product_HASH_VH.tif': b'VH' * 100}
+    with ZipFile(product_zip, 'w') as zip_:
+        for name, content in members.items():
+            zip_.writestr(name, content)
+
+    job = Job('RTC_GAMMA', 'job', '2021-01-01T00:00:00+00:00', 'SUCCEEDED', 'user',
+              files=[{'filename': product_zip.name, 'url': str(product_zip), 'size': 0}])
+    monkeypatch.setattr(helpers.HYP3_REGISTRY, 'get_job_by_id', lambda api, job_id: job)
+    monkeypatch.setattr(helpers, 'RemoteZip', ZipFile)
+
+    # an interrupted --keep run left the directory with a truncated VV tif and no VH tif
+    product_dir = tmp_path / 'main' / 'product_HASH'
+    product_dir.mkdir(parents=True)
+    (product_dir / 'product_HASH_VV.tif').write_bytes(b'VV')
+
+    with helpers.job_tifs('job', 'api', tmp_path / 'main', keep=True) as tifs:
+        assert tifs == [product_dir / 'product_HASH_VH.tif', product_dir / 'product_HASH_VV.tif']
+        assert [tif.read_bytes() for tif in tifs] == [b'VH' * 100, b'VV' * 100]
+
+
+def test_prefetch_job_tifs(tmp_path, monkeypatch):
+    fetched = []
+
+    def mock_fetch_product(job_id, api, directory, member_filter, cache):
+        product_dir = directory / f'{job_id}_HASH'
+        product_dir.mkdir(parents=True)
+        for f in ['b.tif', 'a.tif', 'a.xml', 'stray.tif']:
+            (product_dir / f).touch()
+        fetched.append(job_id)
+        return product_dir, [product_dir / f for f in ['b.tif', 'a.tif', 'a.xml']]
+
+    monkeypatch.setattr(helpers, '_fetch_product', mock_fetch_product)
+
+    job_pairs = [
+        ((f'main{ii}', 'main-api', tmp_path / 'main'), (f'develop{ii}', 'develop-api', tmp_path / 'develop'))
+        for ii in range(3)
+    ]
+    for ii, (main_tifs, develop_tifs) in enumerate(helpers.prefetch_job_tifs(job_pairs, prefetch=1)):
+        assert main_tifs == [tmp_path / 'main' / f'main{ii}_HASH' / f for f in ['a.tif', 'b.tif']]
+        assert develop_tifs == [tmp_path / 'develop' / f'develop{ii}_HASH' / f for f in ['a.tif', 'b.tif']]
+        if ii > 0:
+            assert not (tmp_path / 'main' / f'main{ii - 1}_HASH').exists()
+
+    assert sorted(fetched) == sorted([job[0] for pair in job_pairs for job in pair])
+    assert list((tmp_path / 'main').iterdir()) == []
+    assert list((tmp_path / 'develop').iterdir()) == []
+
+    for main_tifs, develop_tifs in helpers.prefetch_job_tifs(job_pairs[:2], keep=True):
+        pass
+    assert (tmp_path / 'main' / 'main0_HASH' / 'a.tif').exists()
+    assert (tmp_path / 'develop' / 'develop1_HASH' / 'a.tif').exists()
+
+
+def test_prefetch_job_tifs_failed_fetch(tmp_path, monkeypatch):
+    def mock_fetch_product(job_id, api, directory, member_filter, cache):
+        if job_id == 'develop':
+            raise HyP3Error('Download failed')
+        product_dir = directory / f'{job_id}_HASH'
+        product_dir.mkdir(parents=True)
+        (product_dir / 'a.tif').touch()
+        return product_dir, [product_dir / 'a.tif']
+
+    monkeypatch.setattr(helpers, '_fetch_product', mock_fetch_product)
+
+    job_pairs = [(('main', 'main-api', tmp_path / 'main'), ('develop', 'develop-api', tmp_path / 'develop'))]
+    with pytest.raises(HyP3Error, match='Download failed'):
+        next(helpers.prefetch_job_tifs(job_pairs))
+    assert list((tmp_path / 'main').iterdir()) == []
+
+    with pytest.raises(HyP3Error, match='Download failed'):
+        next(helpers.prefetch_job_tifs(job_pairs, keep=True))
+    assert (tmp_path / 'main' / 'main_HASH' / 'a.tif').exists()
+
+
+def test_remove_product(tmp_path):
+    product_dir = tmp_path / 'product_HASH'
+    helpers._remove_product(product_dir)  # e.g., no member matched the member filter
+
+    (product_dir / 'nested').mkdir(parents=True)
+    (product_dir / 'nested' / 'a.tif').touch()
+    (product_dir / 'b.tif').touch()
+    helpers._remove_product(product_dir)
+    assert not product_dir.exists()
+
+
+def test_difference_maps_outlive_products(tmp_path, monkeypatch):
+    def mock_fetch_product(job_id, api, directory, member_filter, cache):
+        product_dir = directory / f'{job_id}_HASH'
+        product_dir.mkdir(parents=True)
+        (product_dir / 'a.tif').touch()
+        return product_dir, [product_dir / 'a.tif']
+
+    monkeypatch.setattr(helpers, '_fetch_product', mock_fetch_product)
+
+    job_pairs = [(('main', 'main-api', tmp_path / 'main'), ('develop', 'develop-api', tmp_path / 'develop'))]
+    for _, (develop_tif,) in helpers.prefetch_job_tifs(job_pairs):
+        difference_map = helpers.difference_map_path(tmp_path / 'develop', develop_tif)
+        compare.save_tile_differences(difference_map, compare.tile_differences(np.zeros((2, 2)), np.ones((2, 2))))
+
+    assert difference_map == tmp_path / 'develop' / 'tile_differences' / 'develop_HASH' / 'a.npz'
+    assert difference_map.exists()
+    assert not (tmp_path / 'develop' / 'develop_HASH').exists()
+
+
+def _serve_stub_hyp3(polls_until_complete: dict) -> ThreadingHTTPServer:
+    """Serve a stub HyP3 API whose jobs succeed after the number of polls in `polls_until_complete`"""
+    polls = {job_id: 0 for job_id in polls_until_complete}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            job_id = self.path.split('/')[-1]
+            polls[job_id] += 1
+            status_code = 'SUCCEEDED' if polls[job_id] >= polls_until_complete[job_id] else 'RUNNING'
+            job = {'job_type': 'RTC_GAMMA', 'job_id': job_id, 'request_time': '2021-01-01T00:00:00+00:00',
+                   'status_code': status_code, 'user_id': 'user'}
+
+            body = json.dumps(job).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.polls = polls
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _stub_jobs(job_ids):
+    return [Job('RTC_GAMMA', job_id, '2021-01-01T00:00:00+00:00', 'PENDING', 'user') for job_id in job_ids]
+
+
+def test_watch_job_pairs():
+    main_server = _serve_stub_hyp3({'main-0': 1, 'main-1': 4})
+    develop_server = _serve_stub_hyp3({'develop-0': 2, 'develop-1': 1})
+    try:
+        main_hyp3 = HyP3(f'http://127.0.0.1:{main_server.server_port}', token='token')
+        develop_hyp3 = HyP3(f'http://127.0.0.1:{develop_server.server_port}', token='token')
+
+        async def watch():
+            return [
+                (index, main.job_id, develop.job_id, main.succeeded() and develop.succeeded())
+                async for index, main, develop in helpers.watch_job_pairs(
+                    main_hyp3, _stub_jobs(['main-0', 'main-1']), develop_hyp3, _stub_jobs(['develop-0', 'develop-1']),
+                    interval=0.01, max_interval=0.02,
+                )
+            ]
+
+        # the first pair is yielded while main-1 is still running
+        assert asyncio.run(watch()) == [(0, 'main-0', 'develop-0', True), (1, 'main-1', 'develop-1', True)]
+
+        # completed jobs are no longer polled
+        assert main_server.polls == {'main-0': 1, 'main-1': 4}
+        assert develop_server.polls == {'develop-0': 2, 'develop-1': 1}
+
+        with pytest.raises(HyP3Error, match='1 of 1 job pairs'):
+            helpers.watch_environments(main_hyp3, _stub_jobs(['main-1']), develop_hyp3, [], interval=0.01, timeout=0)
+    finally:
+        main_server.shutdown()
+        develop_server.shutdown()
+
+
+def test_determine_products_files(monkeypatch):
+    monkeypatch.setattr(helpers, '_PRODUCT_LISTINGS', {})
+
+    listed = []
+
+    def mock_list_product(job, session=None):
+        listed.append((job.job_id, session))
+        product_name = f'S1_{job.job_id}_ABCD'
+        members = [{'filename': f'{product_name}/', 'size': 0, 'crc': 0},
+                   {'filename': f'{product_name}/{product_name}_VV.tif', 'size': 1, 'crc': 1}]
+        return {'filename': f'{product_name}.zip', 'url': 'url', 'members': members}
+
+    monkeypatch.setattr(helpers, '_list_product', mock_list_product)
+
+    jobs = _stub_jobs(['a', 'b', 'c'])
+    assert helpers.determine_products_files(jobs, max_workers=2) == [
+        (f'S1_{job_id}_ABCD', {f'S1_{job_id}_HASH/S1_{job_id}_HASH_VV.tif'}) for job_id in ['a', 'b', 'c']
+    ]
+    assert sorted(job_id for job_id, _ in listed) == ['a', 'b', 'c']
+    assert len({session for _, session in listed}) == 1
+
+    # listings are reused for the rest of the session
+    assert helpers.determine_product_files(jobs[1]) == ('S1_b_ABCD', {'S1_b_HASH/S1_b_HASH_VV.tif'})
+    helpers.determine_products_files(jobs)
+    assert len(listed) == 3
+
+
+def test_hyp3_registry(monkeypatch):
+    server = _serve_stub_hyp3({'a': 2})
+    api = f'http://127.0.0.1:{server.server_port}'
+    monkeypatch.setattr(helpers, 'HyP3', lambda api_url, *args: HyP3(api_url, token='token'))
+    try:
+        registry = helpers.HyP3Registry(ttl=60)
+        assert registry.client(api) is registry.client(api)
+
+        # running jobs are not memoized
+        assert registry.get_job_by_id(api, 'a').running()
+        assert registry.get_job_by_id(api, 'a').succeeded()
+        assert registry.get_job_by_id(api, 'a').succeeded()
+        assert server.polls == {'a': 2}
+
+        registry.ttl = 0
+        registry._jobs.clear()
+        registry.get_job_by_id(api, 'a')
+        registry.get_job_by_id(api, 'a')
+        assert server.polls == {'a': 4}
+
+        assert registry.stats == {'client_hits': 5, 'client_misses': 1, 'job_hits': 1, 'job_misses': 4}
+    finally:
+        server.shutdown()
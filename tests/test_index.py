@@ -0,0 +1,30 @@
+from functools import partial
+
+from hyp3_testing import compare
+from hyp3_testing import index
+
+
+def test_comparison_key():
+    key = index.comparison_key(compare.bit_for_bit)
+    assert key.endswith(':hyp3_testing.compare.bit_for_bit')
+
+    tolerance_key = index.comparison_key(partial(compare.raster_values_are_close, rtol=0.0, atol=1.0))
+    assert tolerance_key != index.comparison_key(partial(compare.raster_values_are_close, rtol=0.0, atol=2.0))
+    assert tolerance_key == index.comparison_key(partial(compare.raster_values_are_close, atol=1.0, rtol=0.0))
+
+
+def test_comparison_index(tmp_path):
+    comparison_index = index.ComparisonIndex(tmp_path / 'index' / 'comparisons.sqlite')
+    assert comparison_index.get('comparison', 'a', 'b') is None
+
+    comparison_index.put('comparison', 'a', 'b', passed=False)
+    assert comparison_index.get('comparison', 'a', 'b') is False
+    comparison_index.put('comparison', 'a', 'b', passed=True)
+    assert comparison_index.get('comparison', 'a', 'b') is True
+    assert comparison_index.get('comparison', 'b', 'a') is None
+    comparison_index.close()
+
+    # verdicts persist across sessions
+    comparison_index = index.ComparisonIndex(tmp_path / 'index' / 'comparisons.sqlite')
+    assert comparison_index.get('comparison', 'a', 'b') is True
+    comparison_index.close()
@@ -1,15 +1,15 @@
 import json
-import os
+from functools import partial
 
-import hyp3_sdk.util
 import pytest
-import rioxarray  # noqa: F401
-import xarray as xr
 from osgeo import gdal
 
 from hyp3_testing import compare
 from hyp3_testing import util
-from hyp3_testing.helpers import job_tifs
+from hyp3_testing.helpers import (
+    difference_map_path, get_hyp3, prefetch_job_tifs, sort_jobs_by_parameters, watch_environments
+)
+from hyp3_testing.raster import Raster
 
 gdal.UseExceptions()
 pytestmark = pytest.mark.golden
@@ -26,7 +26,7 @@ def test_golden_submission(comparison_environments):
     for dir_, api in comparison_environments:
         dir_.mkdir(parents=True, exist_ok=True)
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+        hyp3 = get_hyp3(api)
         jobs = hyp3.submit_prepared_jobs(submission_payload)
         request_time = jobs.jobs[0].request_time.isoformat(timespec='seconds')
         print(f'{dir_.name} request time: {request_time}')
@@ -39,18 +39,21 @@ def test_golden_submission(comparison_environments):
 @pytest.mark.timeout(10800)  # 180 minutes as InSAR jobs can take ~2.5 hrs
 @pytest.mark.dependency()
 def test_golden_wait(comparison_environments, job_name, user_id):
+    environments = []
     for dir_, api in comparison_environments:
         if job_name is None:
             submission_report = dir_ / f'{dir_.name}_submission.json'
             submission_details = json.loads(submission_report.read_text())
             job_name = submission_details['name']
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+        hyp3 = get_hyp3(api)
         jobs = hyp3.find_jobs(name=job_name, user_id=user_id)
 
         assert len(jobs) > 0  # will throw if job_name not associated with user_id
 
-        _ = hyp3.watch(jobs)
+        environments.extend([hyp3, sort_jobs_by_parameters(jobs)])
+
+    _ = watch_environments(*environments)
 
 
 @pytest.mark.dependency(depends=['test_golden_wait'])
@@ -70,43 +73,61 @@ def test_golden_tif_names(jobs_info):
         assert main_normalized_files == develop_normalized_files
 
 
-@pytest.mark.dependency(depends=['test_golden_wait'])
-def test_golden_insar(comparison_environments, jobs_info, keep):
-    (main_dir, main_api), (develop_dir, develop_api) = comparison_environments
+def _compare_tifs(main_tif, develop_tif, tolerances, develop_dir):
+    tolerance = tolerances.resolve(main_tif)
 
-    failure_count = 0
-    messages = []
-    for pair, pair_information in jobs_info.items():
-        with job_tifs(pair_information['main']['job_id'], main_api, main_dir, keep) as main_tifs, \
-                job_tifs(pair_information['develop']['job_id'], develop_api, develop_dir, keep) as develop_tifs:
+    with Raster(main_tif) as main_raster, Raster(develop_tif) as develop_raster:
+        # fail fast on structural differences, before reading any pixels
+        compare.compare_raster_headers(main_raster, develop_raster)
+        compare.compare_raster_info(main_raster, develop_raster)
+        pixel_size = main_raster.pixel_size
 
-            for main_tif, develop_tif in zip(main_tifs, develop_tifs):
-                comparison_header = '\n'.join(['-' * 80, str(main_tif), str(develop_tif), '-' * 80])
+        main_ds = main_raster.read()
+        develop_ds = develop_raster.read()
 
-                main_ds = xr.open_dataset(main_tif, engine='rasterio').band_data.data[0]
-                develop_ds = xr.open_dataset(develop_tif, engine='rasterio').band_data.data[0]
+        statistics = compare.compute_raster_statistics(main_ds, develop_ds)
 
-                try:
-                    compare.compare_raster_info(main_tif, develop_tif)
+        compare.images_are_within_offset_threshold(main_ds, develop_ds, pixel_size=pixel_size,
+                                                   offset_threshold=tolerance['offset_threshold'],
+                                                   statistics=statistics)
 
-                    pixel_size = gdal.Info(str(main_tif), format='json')['geoTransform'][1]
-                    compare.images_are_within_offset_threshold(main_ds, develop_ds, pixel_size=pixel_size,
-                                                               offset_threshold=5.0)
+        compare.maskes_are_within_similarity_threshold(main_ds, develop_ds, mask_rate=tolerance['mask_rate'],
+                                                       statistics=statistics)
 
-                    compare.maskes_are_within_similarity_threshold(main_ds, develop_ds, mask_rate=0.98)
+        compare.values_are_within_statistic(main_ds, develop_ds, confidence_level=tolerance['confidence_level'],
+                                            statistics=statistics,
+                                            difference_map=difference_map_path(develop_dir, develop_tif))
 
-                    compare.values_are_within_statistic(main_ds, develop_ds, confidence_level=0.99)
+        if 'nodata_threshold' in tolerance:
+            compare.nodata_count_change_are_within_threshold(main_ds, develop_ds,
+                                                             threshold=tolerance['nodata_threshold'],
+                                                             statistics=statistics)
 
-                    if '_unw_phase.tif' in str(main_tif):
-                        compare.nodata_count_change_are_within_threshold(main_ds, develop_ds, threshold=0.01)
+        if 'corr_threshold' in tolerance:
+            compare.corr_average_decrease_within_threshold(main_ds, develop_ds,
+                                                           threshold=tolerance['corr_threshold'],
+                                                           statistics=statistics)
 
-                    if '_corr.tif' in str(main_tif):
-                        compare.corr_average_decrease_within_threshold(main_ds, develop_ds, threshold=0.05)
 
-                except compare.ComparisonFailure as e:
-                    messages.append(f'{comparison_header}\n{e}')
-                    failure_count += 1
+@pytest.mark.dependency(depends=['test_golden_wait'])
+def test_golden_insar(comparison_environments, jobs_info, keep, max_workers, product_cache,
+                      comparison_index, insar_tolerances):
+    (main_dir, main_api), (develop_dir, develop_api) = comparison_environments
+
+    job_pairs = [
+        ((pair_information['main']['job_id'], main_api, main_dir),
+         (pair_information['develop']['job_id'], develop_api, develop_dir))
+        for pair_information in jobs_info.values()
+    ]
+    comparison = partial(_compare_tifs, tolerances=insar_tolerances, develop_dir=develop_dir)
+
+    messages = []
+    with compare.comparison_pool(max_workers) as pool:
+        for main_tifs, develop_tifs in prefetch_job_tifs(job_pairs, keep, cache=product_cache):
+            messages.extend(
+                compare.run_comparisons(comparison, zip(main_tifs, develop_tifs), index=comparison_index, pool=pool)
+            )
 
     if messages:
-        messages.insert(0, f'{failure_count} differences found!!')
+        messages.insert(0, f'{len(messages)} differences found!!')
         raise compare.ComparisonFailure('\n\n'.join(messages))
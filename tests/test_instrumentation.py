@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from hyp3_testing import compare
+from hyp3_testing import instrumentation
+
+
+@pytest.fixture
+def instrumented():
+    instrumentation.collect_events()
+    instrumentation.enable(sample_interval=0.001)
+    yield
+    instrumentation.disable()
+    instrumentation.collect_events()
+
+
+def test_stage(instrumented):
+    with instrumentation.stage('load', 'loading', path='a.tif'):
+        data = bytearray(50 * 2 ** 20)
+        del data
+
+    event, = instrumentation.collect_events()
+    assert event['name'] == 'load'
+    assert event['cat'] == 'loading'
+    assert event['ph'] == 'X'
+    assert event['pid'] == os.getpid()
+    assert event['args']['path'] == 'a.tif'
+    assert event['args']['peak_rss_mb'] >= event['args']['rss_mb']
+    assert instrumentation.collect_events() == []
+
+
+def test_stage_disabled():
+    with instrumentation.stage('load'):
+        pass
+    assert instrumentation.collect_events() == []
+
+
+def test_instrumented(instrumented):
+    @instrumentation.instrumented('compare', arg_names=('reference', 'secondary'))
+    def comparison(reference, secondary, tolerance=0.0):
+        return reference == secondary
+
+    assert not comparison('a', secondary='b')
+    event, = instrumentation.collect_events()
+    assert event['name'] == 'comparison'
+    assert event['args']['reference'] == 'a'
+    assert event['args']['secondary'] == 'b'
+    assert comparison.__name__ == 'comparison'
+
+
+def test_run_comparisons_events(tmp_path, instrumented):
+    file_pairs = []
+    for ii in range(3):
+        ref_file = tmp_path / f'ref_{ii}.txt'
+        ref_file.write_text('hello')
+        file_pairs.append((ref_file, ref_file))
+
+    assert compare.run_comparisons(compare.bit_for_bit, file_pairs, max_workers=2) == []
+
+    events = instrumentation.collect_events()
+    files = [event['args']['reference'] for event in events if event['name'] == 'compare_files']
+    assert sorted(files) == sorted(str(ref_file) for ref_file, _ in file_pairs)
+    assert len([event for event in events if event['name'] == 'bit_for_bit']) == 3
+    assert all(event['pid'] != os.getpid() for event in events)
+
+
+def test_run_comparisons_events_not_duplicated(tmp_path, instrumented):
+    ref_file = tmp_path / 'ref.txt'
+    ref_file.write_text('hello')
+
+    with instrumentation.stage('download', 'hyp3'):
+        pass
+    assert compare.run_comparisons(compare.bit_for_bit, [(ref_file, ref_file)] * 4, max_workers=2) == []
+
+    events = instrumentation.collect_events()
+    assert len([event for event in events if event['name'] == 'download']) == 1
+    assert len([event for event in events if event['name'] == 'bit_for_bit']) == 4
+
+
+def test_write_chrome_trace(tmp_path, instrumented):
+    for _ in range(2):
+        with instrumentation.stage('download', 'hyp3'):
+            pass
+
+    report = json.loads(instrumentation.write_chrome_trace(tmp_path / 'trace.json').read_text())
+    assert len(report['traceEvents']) == 2
+    assert report['otherData']['stages']['hyp3:download']['count'] == 2
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from hyp3_testing import compare
+from hyp3_testing.raster import Raster
+
+
+def _write_raster(path, data, nodata=None, **kwargs):
+    profile = dict(driver='GTiff', height=data.shape[0], width=data.shape[1], count=1, dtype=data.dtype,
+                   transform=from_origin(0, 0, 30, 30), nodata=nodata, **kwargs)
+    with rasterio.open(path, 'w', **profile) as dataset:
+        dataset.write(data, 1)
+    return path
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'complex64'])
+def test_raster_memmap(tmp_path, dtype):
+    data = np.arange(200 * 300, dtype=dtype).reshape(200, 300)
+
+    with Raster(_write_raster(tmp_path / 'striped.tif', data)) as raster:
+        assert raster.pixel_size == 30
+        assert isinstance(raster.memmap(), np.memmap)
+        assert isinstance(raster.read(), np.memmap)
+        np.testing.assert_array_equal(raster.read(), data)
+
+    for name, options in [('deflate.tif', {'compress': 'deflate'}),
+                          ('tiled.tif', {'tiled': True, 'blockxsize': 64, 'blockysize': 64})]:
+        with Raster(_write_raster(tmp_path / name, data, **options)) as raster:
+            assert raster.memmap() is None
+            assert not isinstance(raster.read(), np.memmap)
+            np.testing.assert_array_equal(raster.read(), data)
+
+
+def test_raster_read_nodata(tmp_path):
+    data = np.arange(100 * 100, dtype='int16').reshape(100, 100)
+    data[0, :] = 0
+
+    for name, options in [('striped.tif', {}), ('deflate.tif', {'compress': 'deflate'})]:
+        with Raster(_write_raster(tmp_path / name, data, nodata=0, **options)) as raster:
+            read = raster.read()
+            assert read.dtype == np.float32
+            np.testing.assert_array_equal(np.isnan(read), data == 0)
+            np.testing.assert_array_equal(read[1:], data[1:])
+
+    float_data = np.ones((100, 100), dtype='float32')
+    with Raster(_write_raster(tmp_path / 'no_nodata_pixels.tif', float_data, nodata=0)) as raster:
+        assert isinstance(raster.read(), np.memmap)
+
+
+def test_raster_values_are_close_shares_dataset(tmp_path):
+    data = np.random.default_rng(0).random((100, 100), dtype='float32')
+    reference = _write_raster(tmp_path / 'reference.tif', data)
+    secondary = _write_raster(tmp_path / 'secondary.tif', data + 1)
+
+    with Raster(reference) as ref, Raster(secondary) as sec:
+        compare.raster_values_are_close(ref, ref)
+        with pytest.raises(compare.ComparisonFailure, match='Values are different'):
+            compare.raster_values_are_close(ref, sec)
+        assert not ref.dataset.closed
+
+
+def test_raster_header(tmp_path):
+    data = np.zeros((20, 30), dtype='int16')
+    reference = _write_raster(tmp_path / 'reference.tif', data, nodata=0)
+    secondary = _write_raster(tmp_path / 'secondary.tif', data.astype('float32'), nodata=0)
+
+    with Raster(reference) as ref, Raster(secondary) as sec:
+        assert ref.header['shape'] == (1, 20, 30)
+        assert ref.header['transform'] == (30, 0, 0, 0, -30, 0)
+        assert ref.header is ref.header
+        compare.compare_raster_headers(ref, reference)
+        with pytest.raises(compare.ComparisonFailure, match=r"dtypes: reference \('int16',\); secondary"):
+            compare.compare_raster_headers(ref, sec)
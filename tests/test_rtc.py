@@ -1,15 +1,14 @@
 import json
-import os
-from pathlib import Path
+from functools import partial
 
-import hyp3_sdk.util
 import pytest
-import rioxarray  # noqa: F401
-import xarray as xr
 
 from hyp3_testing import compare
 from hyp3_testing import util
-from hyp3_testing.helpers import job_tifs
+from hyp3_testing.helpers import (
+    difference_map_path, get_hyp3, prefetch_job_tifs, sort_jobs_by_parameters, watch_environments
+)
+from hyp3_testing.raster import Raster
 
 pytestmark = pytest.mark.golden
 
@@ -25,7 +24,7 @@ def test_golden_submission(comparison_environments):
     for dir_, api in comparison_environments:
         dir_.mkdir(parents=True, exist_ok=True)
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+        hyp3 = get_hyp3(api)
         jobs = hyp3.submit_prepared_jobs(submission_payload)
         request_time = jobs.jobs[0].request_time.isoformat(timespec='seconds')
         print(f'{dir_.name} request time: {request_time}')
@@ -38,18 +37,21 @@ def test_golden_submission(comparison_environments):
 @pytest.mark.timeout(5400)  # 90 minutes as RTC jobs can take ~1.5 hr
 @pytest.mark.dependency()
 def test_golden_wait(comparison_environments, job_name, user_id):
+    environments = []
     for dir_, api in comparison_environments:
         if job_name is None:
             submission_report = dir_ / f'{dir_.name}_submission.json'
             submission_details = json.loads(submission_report.read_text())
             job_name = submission_details['name']
 
-        hyp3 = hyp3_sdk.HyP3(api, os.environ.get('EARTHDATA_LOGIN_USER'), os.environ.get('EARTHDATA_LOGIN_PASSWORD'))
+        hyp3 = get_hyp3(api)
         jobs = hyp3.find_jobs(name=job_name, user_id=user_id)
 
         assert len(jobs) > 0  # will throw if job_name not associated with user_id
 
-        _ = hyp3.watch(jobs)
+        environments.extend([hyp3, sort_jobs_by_parameters(jobs)])
+
+    _ = watch_environments(*environments)
 
 
 @pytest.mark.dependency(depends=['test_golden_wait'])
@@ -69,35 +71,38 @@ def test_golden_tif_names(jobs_info):
         assert main_normalized_files == develop_normalized_files
 
 
-@pytest.mark.dependency(depends=['test_golden_wait'])
-def test_golden_rtc(comparison_environments, jobs_info, rtc_tolerances, keep):
-    (main_dir, main_api), (develop_dir, develop_api) = comparison_environments
+def _compare_tifs(main_tif, develop_tif, tolerances, develop_dir):
+    tolerance = tolerances.resolve(main_tif)
 
-    failure_count = 0
-    messages = []
-    for pair, pair_information in jobs_info.items():
-        pair_tolerances = rtc_tolerances[pair]
+    with Raster(main_tif) as main_raster, Raster(develop_tif) as develop_raster:
+        compare.compare_raster_headers(main_raster, develop_raster)
+        compare.compare_raster_info(main_raster, develop_raster)
+        compare.raster_values_are_close(main_raster, develop_raster, rtol=tolerance['rtol'], atol=tolerance['atol'],
+                                        difference_map=difference_map_path(develop_dir, develop_tif))
 
-        with job_tifs(pair_information['main']['job_id'], main_api, main_dir, keep) as main_tifs, \
-                job_tifs(pair_information['develop']['job_id'], develop_api, develop_dir, keep) as develop_tifs:
 
-            for main_tif, develop_tif in zip(main_tifs, develop_tifs):
-                file_type = '_'.join(Path(main_tif).name.split('_')[8:])[:-4]
+@pytest.mark.dependency(depends=['test_golden_wait'])
+def test_golden_rtc(comparison_environments, jobs_info, rtc_tolerances, keep, max_workers, product_cache,
+                    comparison_index):
+    (main_dir, main_api), (develop_dir, develop_api) = comparison_environments
 
-                file_tolerance = pair_tolerances[file_type]
-                absolute_tolerance, relative_tolerance = file_tolerance['atol'], file_tolerance['rtol']
+    job_pairs = [
+        ((pair_information['main']['job_id'], main_api, main_dir),
+         (pair_information['develop']['job_id'], develop_api, develop_dir))
+        for pair_information in jobs_info.values()
+    ]
 
-                comparison_header = '\n'.join(['-' * 80, str(main_tif), str(develop_tif), '-' * 80])
+    comparison = partial(_compare_tifs, tolerances=rtc_tolerances, develop_dir=develop_dir)
+
+    messages = []
+    with compare.comparison_pool(max_workers) as pool:
+        for main_tifs, develop_tifs in prefetch_job_tifs(job_pairs, keep, cache=product_cache):
+            rtc_tolerances.resolve_all(main_tifs)  # fail fast on any tif without a tolerance
 
-                main_ds = xr.open_dataset(main_tif, engine='rasterio')
-                develop_ds = xr.open_dataset(develop_tif, engine='rasterio')
-                try:
-                    compare.compare_raster_info(main_tif, develop_tif)
-                    compare.values_are_close(main_ds, develop_ds, rtol=relative_tolerance, atol=absolute_tolerance)
-                except compare.ComparisonFailure as e:
-                    messages.append(f'{comparison_header}\n{e}')
-                    failure_count += 1
+            messages.extend(
+                compare.run_comparisons(comparison, zip(main_tifs, develop_tifs), index=comparison_index, pool=pool)
+            )
 
     if messages:
-        messages.insert(0, f'{failure_count} differences found!!')
+        messages.insert(0, f'{len(messages)} differences found!!')
         raise compare.ComparisonFailure('\n\n'.join(messages))
@@ -0,0 +1,54 @@
+import pickle
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from hyp3_testing import compare
+from hyp3_testing.index import comparison_key
+from hyp3_testing.tolerances import ToleranceRegistry
+
+
+def test_tolerance_registry():
+    registry = ToleranceRegistry({
+        '*.tif': {'confidence_level': 0.99, 'mask_rate': 0.98},
+        '*_corr.tif': {'corr_threshold': 0.05, 'mask_rate': 0.95},
+    })
+
+    assert registry.resolve('product_amp.tif') == {'confidence_level': 0.99, 'mask_rate': 0.98}
+    assert registry.resolve(Path('dir') / 'product_corr.tif') == {
+        'confidence_level': 0.99, 'mask_rate': 0.95, 'corr_threshold': 0.05
+    }
+
+    registry.resolve('product_amp.tif')['mask_rate'] = 0.0
+    assert registry.resolve('product_amp.tif')['mask_rate'] == 0.98
+
+    with pytest.raises(KeyError, match='product.png'):
+        registry.resolve('product.png')
+
+    assert len(registry.resolve_all(['a_amp.tif', 'a_corr.tif'])) == 2
+    with pytest.raises(KeyError, match='a.png, a.xml'):
+        registry.resolve_all(['a_amp.tif', 'a.png', 'a.xml'])
+
+    assert pickle.loads(pickle.dumps(registry)).resolve('a_corr.tif') == registry.resolve('a_corr.tif')
+    assert repr(pickle.loads(pickle.dumps(registry))) == repr(registry)
+    assert comparison_key(partial(compare.values_are_close, tolerances=registry)) == comparison_key(
+        partial(compare.values_are_close, tolerances=ToleranceRegistry(registry.tolerances))
+    )
+
+
+def test_tolerance_registry_from_template():
+    rtc = ToleranceRegistry.from_template('RTC_GAMMA')
+    product = 'S1A_IW_20150621T120220_SVP_RTC30_G_sprfed_0D8C'
+    assert rtc.resolve(f'{product}_VV.tif') == {'rtol': 2e-05, 'atol': 1e-05}
+    assert rtc.resolve(f'{product}_ls_map.tif') == {'rtol': 0.0, 'atol': 0.0}
+    assert rtc.resolve(f'{product}_rgb.tif') == {'rtol': 0.0, 'atol': 1.0}
+    assert len(rtc.resolve_all(f'{product}_{suffix}.tif' for suffix in ['VV', 'VH', 'area', 'inc_map', 'dem'])) == 5
+
+    for job_type in ['INSAR_GAMMA', 'INSAR_ISCE_BURST']:
+        insar = ToleranceRegistry.from_template(job_type)
+        assert 'nodata_threshold' in insar.resolve('S1AA_20200101T000000_unw_phase.tif')
+        assert 'corr_threshold' in insar.resolve('S1AA_20200101T000000_corr.tif')
+        assert insar.resolve('S1AA_20200101T000000_amp.tif').keys() == {
+            'offset_threshold', 'mask_rate', 'confidence_level'
+        }
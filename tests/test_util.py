@@ -16,3 +16,24 @@ def test_render_template():
         util.render_template('insar_gamma_golden.json.j2')
 
     util.render_template('insar_gamma_golden.json.j2', name='test')
+
+
+def test_get_environment():
+    assert util.get_environment() is util.get_environment()
+
+
+def test_render_template_memoized():
+    util._render_template.cache_clear()
+
+    payload = util.render_template('insar_gamma_golden.json.j2', name='memoized')
+    payload.clear()
+    again = util.render_template('insar_gamma_golden.json.j2', name='memoized')
+    assert again and again == util.render_template('insar_gamma_golden.json.j2', name='memoized')
+    assert util._render_template.cache_info().misses == 1
+
+    assert util.render_template('insar_gamma_golden.json.j2', name='other') != again
+
+    payloads = util.render_templates(['insar_gamma_golden.json.j2', 'rtc_gamma_golden.json.j2'], name='memoized')
+    assert list(payloads) == ['insar_gamma_golden.json.j2', 'rtc_gamma_golden.json.j2']
+    assert payloads['insar_gamma_golden.json.j2'] == again
+    assert util._render_template.cache_info().misses == 3